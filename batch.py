@@ -0,0 +1,251 @@
+"""Transcribe and subtitle a directory (or manifest) of videos without the UI.
+
+ffmpeg work (audio extraction, rendering) runs on a bounded process pool while
+transcription requests run concurrently on the event loop. Every finished file
+gets a result.json next to its outputs, so an interrupted run can be resumed
+and files completed with the same options are skipped.
+
+    python batch.py videos/ -o out/ --render burn
+    python batch.py manifest.jsonl -o out/ --workers 2 --transcribe-concurrency 8
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import cpu_count, get_context
+from video_processor import (
+    add_subtitles_to_video,
+    audio_path_for_profile,
+    extract_audio,
+    mux_subtitles,
+    probe_duration,
+    resolve_audio_profile,
+)
+from subtitle_generator import generate_subtitles
+from transcriber import transcribe_audio, transcribe_long_audio, transcribe_speech_only, LONG_MEDIA_THRESHOLD
+from transcription_cache import transcription_cache_key, load_transcription, store_transcription
+from disk_cache import file_sha256
+from metrics import queue_wait, span, start_metrics_server
+from vad import VAD_TRIM
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".mkv", ".m4v", ".webm", ".avi")
+RESULT_NAME = "result.json"
+
+def load_inputs(source, language, model):
+    """List input jobs from a directory or a manifest file.
+
+    A manifest is either plain text with one path per line or JSON lines with
+    a "path" and optional "language"/"model" overrides. Relative paths are
+    resolved against the manifest's directory.
+    """
+    if os.path.isdir(source):
+        return [
+            {"path": os.path.join(root, name), "language": language, "model": model}
+            for root, _, files in sorted(os.walk(source))
+            for name in sorted(files)
+            if name.lower().endswith(VIDEO_EXTENSIONS)
+        ]
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    inputs = []
+    with open(source, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            entry = json.loads(line) if line.startswith('{') else {"path": line}
+            entry.setdefault("language", language)
+            entry.setdefault("model", model)
+            entry["path"] = os.path.join(base_dir, entry["path"])
+            inputs.append(entry)
+    return inputs
+
+def output_dir_for(input_path, source, output_root):
+    # Mirror the input layout so files with the same name in different folders do not collide
+    root = source if os.path.isdir(source) else os.path.dirname(os.path.abspath(source))
+    relative = os.path.relpath(os.path.abspath(input_path), os.path.abspath(root))
+    if relative.startswith(os.pardir):
+        relative = os.path.basename(input_path)
+    return os.path.join(output_root, os.path.splitext(relative)[0])
+
+def load_result(output_dir):
+    try:
+        with open(os.path.join(output_dir, RESULT_NAME), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_result(output_dir, result):
+    path = os.path.join(output_dir, RESULT_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(result, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def item_options(entry, args):
+    """Settings that decide a file's outputs; a result only counts as complete for the same ones."""
+    options = {"language": entry["language"], "model": entry["model"], "speech_only": args.speech_only, "render": args.render}
+    if args.render != "none":
+        options["style"] = [args.font_color, args.bg_color, args.font_size, args.transparency]
+    if args.render == "soft":
+        options["soft_container"] = args.soft_container
+    return options
+
+def is_complete(result, options):
+    return (
+        result is not None
+        and result.get("status") == "done"
+        and result.get("options") == options
+        and all(os.path.exists(path) for path in result.get("outputs", {}).values())
+    )
+
+class BatchRunner:
+    def __init__(self, args):
+        self.args = args
+        # Spawned, not forked: the parent has live threads (metrics server, transcription
+        # client loop) whose locks a forked child could inherit while held
+        self.pool = ProcessPoolExecutor(max_workers=args.workers, mp_context=get_context("spawn"))
+        self.transcribe_semaphore = asyncio.Semaphore(args.transcribe_concurrency)
+        # Bound files in flight so scratch audio does not pile up ahead of the pool
+        self.in_flight = asyncio.Semaphore(args.workers + args.transcribe_concurrency)
+        self.render_threads = max(1, cpu_count() // args.workers)
+
+    async def run_in_pool(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.pool, func, *args)
+
+    async def store_transcription(self, cache_key, transcription, duration):
+        # A cache failure must not fail a file whose transcription succeeded
+        try:
+            await asyncio.to_thread(store_transcription, cache_key, transcription, duration)
+        except OSError as e:
+            logging.warning(f"Could not cache transcription: {str(e)}")
+
+    async def transcribe(self, entry, video_path, output_dir):
+        media_hash = await asyncio.to_thread(file_sha256, video_path)
+        audio_profile = await asyncio.to_thread(resolve_audio_profile, video_path)
+        cache_key = transcription_cache_key(media_hash, entry["language"], entry["model"], audio_profile, self.args.speech_only)
+        cached = await asyncio.to_thread(load_transcription, cache_key)
+        if cached is not None:
+            return cached
+
+        if self.args.speech_only:
+            async with self.transcribe_semaphore:
+                transcription, duration = await transcribe_speech_only(video_path, output_dir, entry["language"], entry["model"], audio_profile)
+            await self.store_transcription(cache_key, transcription, duration)
+            return transcription, duration
+
+        audio_path = audio_path_for_profile(output_dir, audio_profile)
+        await self.run_in_pool(extract_audio, video_path, audio_path, audio_profile)
+        try:
+            duration = await asyncio.to_thread(probe_duration, audio_path)
+            async with self.transcribe_semaphore:
+                if duration > LONG_MEDIA_THRESHOLD:
+                    transcription, duration = await transcribe_long_audio(audio_path, entry["language"], entry["model"], audio_profile)
+                else:
+                    transcription, duration = await transcribe_audio(audio_path, entry["language"], entry["model"])
+        finally:
+            if not self.args.keep_audio and os.path.exists(audio_path):
+                os.remove(audio_path)
+        await self.store_transcription(cache_key, transcription, duration)
+        return transcription, duration
+
+    async def render(self, video_path, subtitle_file, output_dir):
+        args = self.args
+        style = (args.font_color, args.bg_color, args.font_size, args.transparency)
+        if args.render == "soft":
+            output_path = os.path.join(output_dir, f"subtitled{args.soft_container}")
+            await self.run_in_pool(mux_subtitles, video_path, subtitle_file, output_path, *style)
+        else:
+            output_path = os.path.join(output_dir, "subtitled.mp4")
+            await self.run_in_pool(add_subtitles_to_video, video_path, subtitle_file, output_path, *style, self.render_threads)
+        return output_path
+
+    async def process(self, entry):
+        video_path = entry["path"]
+        output_dir = output_dir_for(video_path, self.args.source, self.args.output)
+        previous = load_result(output_dir)
+        options = item_options(entry, self.args)
+        if self.args.resume and is_complete(previous, options):
+            logging.info(f"Skipping {video_path}, already completed")
+            return dict(previous, skipped=True)
+        if self.args.resume and previous is not None and previous.get("status") == "done":
+            logging.info(f"Reprocessing {video_path}, completed with different options")
+
+        queued_time = time.time()
+        async with self.in_flight:
+            os.makedirs(output_dir, exist_ok=True)
+            start_time = time.time()
+            queue_wait.observe(start_time - queued_time, queue="batch", kind=self.args.render)
+            result = {"input": video_path, "language": entry["language"], "model": entry["model"], "options": options, "outputs": {}}
+            try:
+                with span("batch_file", model=entry["model"], language=entry["language"], input=video_path):
+                    transcription, duration = await self.transcribe(entry, video_path, output_dir)
+                    transcription_time = time.time() - start_time
+                    subtitle_file = await asyncio.to_thread(generate_subtitles, transcription, output_dir)
+                    result["outputs"]["subtitles"] = subtitle_file
+                    if self.args.render != "none":
+                        result["outputs"]["video"] = await self.render(video_path, subtitle_file, output_dir)
+                result.update(status="done", duration=duration, transcription_seconds=transcription_time)
+            except Exception as e:
+                logging.error(f"Failed to process {video_path}: {str(e)}")
+                result.update(status="failed", error=str(e))
+            result["seconds"] = time.time() - start_time
+            write_result(output_dir, result)
+            logging.info(f"{result['status']}: {video_path} in {result['seconds']:.1f}s")
+            return result
+
+    async def run(self, inputs):
+        try:
+            return await asyncio.gather(*(self.process(entry) for entry in inputs))
+        finally:
+            self.pool.shutdown(wait=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="directory of videos or a manifest file (.txt paths or .jsonl entries)")
+    parser.add_argument("-o", "--output", required=True, help="output directory")
+    parser.add_argument("--language", default="fi")
+    parser.add_argument("--model", default="whisper-large")
+    parser.add_argument("--render", choices=["none", "burn", "soft"], default="none", help="video output to produce")
+    parser.add_argument("--soft-container", choices=[".mp4", ".mkv"], default=".mp4")
+    parser.add_argument("--font-color", default="#FFFFFF")
+    parser.add_argument("--bg-color", default="#000000")
+    parser.add_argument("--font-size", type=int, default=10)
+    parser.add_argument("--transparency", type=int, default=70)
+    parser.add_argument("--workers", type=int, default=max(1, cpu_count() // 2), help="processes for ffmpeg work")
+    parser.add_argument("--transcribe-concurrency", type=int, default=4, help="transcription requests in flight")
+    parser.add_argument("--no-resume", dest="resume", action="store_false", help="reprocess files that already completed")
+    parser.add_argument("--keep-audio", action="store_true", help="keep extracted audio next to the outputs")
+    parser.add_argument("--speech-only", action="store_true", default=VAD_TRIM,
+                        help="upload only detected speech, timestamps are mapped back (default from VAD_TRIM)")
+    parser.add_argument("--summary", help="summary file (default: <output>/summary.json)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    start_metrics_server()
+    inputs = load_inputs(args.source, args.language, args.model)
+    if not inputs:
+        print(f"No videos found in {args.source}")
+        return 1
+    os.makedirs(args.output, exist_ok=True)
+
+    start_time = time.time()
+    results = asyncio.run(BatchRunner(args).run(inputs))
+
+    counts = {}
+    for result in results:
+        status = "skipped" if result.get("skipped") else result["status"]
+        counts[status] = counts.get(status, 0) + 1
+    summary = {"source": args.source, "seconds": time.time() - start_time, "counts": counts, "files": results}
+    summary_path = args.summary or os.path.join(args.output, "summary.json")
+    with open(summary_path, "w") as f:
+        json.dump(summary, f, indent=2)
+    print(f"{len(results)} files: " + ", ".join(f"{count} {status}" for status, count in sorted(counts.items())))
+    print(f"Summary written to {summary_path}")
+    return 1 if counts.get("failed") else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+"""Benchmark the extract -> transcribe -> subtitle -> render pipeline on synthetic inputs.
+
+Inputs are generated with ffmpeg lavfi sources and transcription is replaced by
+a local stub, so runs are reproducible and free. Each stage runs in a fresh
+process to measure its own peak RSS (and that of its ffmpeg children).
+
+    python benchmarks/pipeline_benchmark.py run --cases small,medium -o results.json
+    python benchmarks/pipeline_benchmark.py compare baseline.json results.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import resource
+import statistics
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import cpu_count, get_context
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from video_processor import extract_audio, add_subtitles_to_video, audio_path_for_profile, TRANSCRIPTION_AUDIO_PROFILE
+from subtitle_generator import generate_subtitles
+from stub_transcriber import stub_transcribe_audio
+
+# name -> (seconds, width, height, audio source)
+CASES = {
+    "tiny": (15, 854, 480, "sine=frequency=440:sample_rate=44100"),
+    "small": (60, 1280, 720, "sine=frequency=440:sample_rate=44100"),
+    "medium": (300, 1280, 720, "anoisesrc=color=pink:sample_rate=44100:amplitude=0.3"),
+    "large": (600, 1920, 1080, "anoisesrc=color=pink:sample_rate=44100:amplitude=0.3"),
+    "xlarge": (1800, 1920, 1080, "anoisesrc=color=pink:sample_rate=44100:amplitude=0.3"),
+}
+DEFAULT_CASES = "tiny,small"
+
+STYLE = {"font_color": "#FFFFFF", "bg_color": "#000000", "font_size": 10, "transparency": 70}
+
+# The render stage would otherwise pick its preset from the machine load and calibration,
+# so two runs of the same code could encode differently
+DEFAULT_PRESET = "veryfast"
+DEFAULT_CRF = 23
+
+def generate_input(case, work_dir):
+    seconds, width, height, audio = CASES[case]
+    path = os.path.join(work_dir, f"input_{case}.mp4")
+    if os.path.exists(path):
+        return path
+    cmd = [
+        'ffmpeg', '-y', '-v', 'error',
+        '-f', 'lavfi', '-i', f"testsrc2=size={width}x{height}:rate=30",
+        '-f', 'lavfi', '-i', audio,
+        '-t', str(seconds),
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '23', '-g', '60',
+        '-c:a', 'aac', '-b:a', '128k',
+        '-shortest', path + ".part.mp4"
+    ]
+    subprocess.run(cmd, check=True)
+    os.replace(path + ".part.mp4", path)
+    return path
+
+def _transcribe_stage(audio_path, output_path):
+    transcription, duration = asyncio.run(stub_transcribe_audio(audio_path))
+    with open(output_path, "w") as f:
+        json.dump(transcription, f)
+
+def _subtitle_stage(transcription_path, output_dir):
+    with open(transcription_path, "r") as f:
+        transcription = json.load(f)
+    generate_subtitles(transcription, output_dir)
+
+def _measure(func, args, outputs):
+    """Run one stage in the current (fresh) process and report its cost."""
+    start_time = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start_time
+    return {
+        "seconds": elapsed,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "children_peak_rss_kb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        "bytes_written": sum(os.path.getsize(path) for path in outputs if os.path.exists(path)),
+    }
+
+def _run_isolated(func, args, outputs):
+    # A new spawned process per stage so ru_maxrss only covers that stage
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+        return executor.submit(_measure, func, args, outputs).result()
+
+def run_case(case, work_dir):
+    case_dir = os.path.join(work_dir, case)
+    os.makedirs(case_dir, exist_ok=True)
+    video_path = generate_input(case, work_dir)
+    audio_path = audio_path_for_profile(case_dir, TRANSCRIPTION_AUDIO_PROFILE)
+    transcription_path = os.path.join(case_dir, "transcription.json")
+    subtitle_path = os.path.join(case_dir, "subtitles.srt")
+    output_path = os.path.join(case_dir, "output_video.mp4")
+
+    stages = {}
+    stages["extract_audio"] = _run_isolated(extract_audio, (video_path, audio_path), [audio_path])
+    stages["transcribe_stub"] = _run_isolated(_transcribe_stage, (audio_path, transcription_path), [transcription_path])
+    stages["generate_subtitles"] = _run_isolated(_subtitle_stage, (transcription_path, case_dir), [subtitle_path])
+    stages["add_subtitles_to_video"] = _run_isolated(
+        add_subtitles_to_video,
+        (video_path, subtitle_path, output_path, STYLE["font_color"], STYLE["bg_color"], STYLE["font_size"], STYLE["transparency"]),
+        [output_path],
+    )
+    return stages
+
+def _median_stages(runs):
+    merged = {}
+    for stage in runs[0]:
+        merged[stage] = {
+            metric: statistics.median(run[stage][metric] for run in runs)
+            for metric in runs[0][stage]
+        }
+    return merged
+
+def _environment(args):
+    try:
+        ffmpeg_version = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout.splitlines()[0]
+    except (OSError, IndexError):
+        ffmpeg_version = None
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "host": platform.node(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": cpu_count(),
+        "ffmpeg": ffmpeg_version,
+        "commit": commit,
+        "audio_profile": TRANSCRIPTION_AUDIO_PROFILE,
+        "encoder": {"preset": args.preset, "crf": args.crf},
+        "created": time.time(),
+    }
+
+def run(args):
+    cases = [case.strip() for case in args.cases.split(',') if case.strip()]
+    unknown = [case for case in cases if case not in CASES]
+    if unknown:
+        raise SystemExit(f"Unknown cases: {', '.join(unknown)} (choose from {', '.join(CASES)})")
+    os.makedirs(args.work_dir, exist_ok=True)
+    # Inherited by the spawned stage processes
+    os.environ["RENDER_PRESET"] = args.preset
+    os.environ["RENDER_CRF"] = str(args.crf)
+
+    results = {"environment": _environment(args), "repeat": args.repeat, "cases": {}}
+    for case in cases:
+        runs = [run_case(case, args.work_dir) for _ in range(args.repeat)]
+        seconds, width, height, _ = CASES[case]
+        results["cases"][case] = {
+            "input": {"seconds": seconds, "width": width, "height": height},
+            "stages": _median_stages(runs),
+        }
+        for stage, metrics in results["cases"][case]["stages"].items():
+            print(f"{case:8} {stage:24} {metrics['seconds']:9.3f}s  rss {metrics['peak_rss_kb'] / 1024:7.1f} MB  "
+                  f"children {metrics['children_peak_rss_kb'] / 1024:7.1f} MB  written {metrics['bytes_written'] / 1e6:9.2f} MB")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+def compare(args):
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+    with open(args.current, "r") as f:
+        current = json.load(f)
+
+    encoders = [results["environment"].get("encoder") for results in (baseline, current)]
+    if encoders[0] != encoders[1]:
+        print(f"Warning: encoder settings differ ({encoders[0]} vs {encoders[1]}), render stage results are not comparable")
+
+    regressions = 0
+    for case, result in current["cases"].items():
+        if case not in baseline["cases"]:
+            continue
+        for stage, metrics in result["stages"].items():
+            before = baseline["cases"][case]["stages"].get(stage)
+            if before is None:
+                continue
+            for metric in ("seconds", "peak_rss_kb", "children_peak_rss_kb", "bytes_written"):
+                old, new = before[metric], metrics[metric]
+                change = (new - old) / old if old else 0.0
+                flag = ""
+                if change > args.threshold:
+                    flag = "  REGRESSION"
+                    regressions += 1
+                elif change < -args.threshold:
+                    flag = "  improved"
+                print(f"{case:8} {stage:24} {metric:21} {old:14.3f} -> {new:14.3f} ({change:+7.1%}){flag}")
+    if regressions:
+        print(f"{regressions} metric(s) regressed by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the benchmark")
+    run_parser.add_argument("--cases", default=DEFAULT_CASES, help=f"comma-separated cases from {', '.join(CASES)}")
+    run_parser.add_argument("--repeat", type=int, default=3, help="runs per case, the median is reported")
+    run_parser.add_argument("--work-dir", default=os.path.join(ROOT, ".cache", "benchmarks"))
+    run_parser.add_argument("--preset", default=DEFAULT_PRESET, help="x264 preset pinned for the render stage")
+    run_parser.add_argument("--crf", type=int, default=DEFAULT_CRF, help="x264 CRF pinned for the render stage")
+    run_parser.add_argument("-o", "--output", default="bench_results.json")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = subparsers.add_parser("compare", help="compare results against a baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import asyncio
+import random
+from video_processor import probe_duration
+
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+    "incididunt ut labore et dolore magna aliqua ut enim ad minim veniam quis nostrud"
+).split()
+
+def stub_response(duration, sentence_seconds=2.5, sentences_per_paragraph=5, seed=0):
+    """Build a Deepgram-shaped prerecorded response covering duration seconds of speech."""
+    rng = random.Random(seed)
+    words = []
+    paragraphs = []
+    sentences = []
+    t = 0.0
+    while t + 0.5 < duration:
+        sentence_end = min(duration, t + sentence_seconds)
+        count = rng.randint(4, 9)
+        step = (sentence_end - t) / count
+        sentence_words = []
+        for i in range(count):
+            word = rng.choice(WORDS)
+            sentence_words.append(word)
+            words.append({
+                "word": word,
+                "start": t + i * step,
+                "end": t + (i + 1) * step,
+                "confidence": 0.9,
+                "punctuated_word": word,
+            })
+        text = " ".join(sentence_words).capitalize() + "."
+        sentences.append({"text": text, "start": t, "end": sentence_end})
+        if len(sentences) == sentences_per_paragraph:
+            paragraphs.append(_paragraph(sentences))
+            sentences = []
+        t = sentence_end
+    if sentences:
+        paragraphs.append(_paragraph(sentences))
+
+    transcript = " ".join(sentence["text"] for paragraph in paragraphs for sentence in paragraph["sentences"])
+    return {
+        "metadata": {"duration": duration, "channels": 1, "request_id": "stub"},
+        "results": {
+            "channels": [{
+                "alternatives": [{
+                    "transcript": transcript,
+                    "confidence": 0.9,
+                    "words": words,
+                    "paragraphs": {
+                        "transcript": "\n\n".join(
+                            " ".join(sentence["text"] for sentence in paragraph["sentences"]) for paragraph in paragraphs
+                        ),
+                        "paragraphs": paragraphs,
+                    },
+                }]
+            }]
+        },
+    }
+
+def _paragraph(sentences):
+    return {
+        "sentences": list(sentences),
+        "num_words": sum(len(sentence["text"].split()) for sentence in sentences),
+        "start": sentences[0]["start"],
+        "end": sentences[-1]["end"],
+    }
+
+async def stub_transcribe_audio(audio_file, language="fi", model="whisper-large", duration=None, latency=0.0):
+    """Drop-in replacement for transcriber.transcribe_audio that never leaves the machine."""
+    if duration is None:
+        duration = await asyncio.to_thread(probe_duration, audio_file)
+    if latency:
+        await asyncio.sleep(latency)
+    response = stub_response(duration)
+    return response, duration
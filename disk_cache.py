@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+
+CACHE_DIR = os.environ.get("CACHE_DIR", os.path.join(os.getcwd(), ".cache", "videotranscriber"))
+
+HASH_CHUNK_SIZE = 1024 * 1024
+# Staging directories older than this were left by an interrupted write
+STAGING_MAX_AGE = float(os.environ.get("CACHE_STAGING_MAX_AGE", 3600))
+STAGING_PREFIX = ".staging-"
+
+def file_sha256(path, chunk_size=HASH_CHUNK_SIZE):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def make_key(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+class DiskCache:
+    """Directory-per-entry cache with LRU eviction under a byte budget.
+
+    Each entry is a directory named after its key. The directory mtime is
+    bumped on every hit and used as the last-access time for eviction.
+    Entries are written to a staging directory and renamed into place, so a
+    reader never sees a half-written entry. Staging directories count towards
+    the byte budget and are removed once older than STAGING_MAX_AGE.
+    """
+
+    def __init__(self, root, max_bytes, staging_max_age=STAGING_MAX_AGE):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.staging_max_age = staging_max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        self.sweep_staging()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key)
+
+    def get(self, key):
+        entry_dir = self._entry_dir(key)
+        with self._lock:
+            if os.path.isdir(entry_dir):
+                self.hits += 1
+                try:
+                    os.utime(entry_dir)
+                except OSError:
+                    pass
+                return entry_dir
+            self.misses += 1
+            return None
+
+    def staging_dir(self):
+        return tempfile.mkdtemp(prefix=STAGING_PREFIX, dir=self.root)
+
+    def _staging_dirs(self):
+        staging = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not name.startswith(STAGING_PREFIX) or not os.path.isdir(path):
+                continue
+            try:
+                staging.append((os.path.getmtime(path), _dir_size(path), path))
+            except OSError:
+                pass
+        return staging
+
+    def sweep_staging(self):
+        """Remove staging directories left by writes that were interrupted; returns the bytes still staged."""
+        staged = 0
+        now = time.time()
+        for mtime, size, path in self._staging_dirs():
+            if now - mtime > self.staging_max_age:
+                shutil.rmtree(path, ignore_errors=True)
+                logging.info(f"Removed stale cache staging directory {os.path.basename(path)} ({size} bytes)")
+            else:
+                staged += size
+        return staged
+
+    def commit(self, key, staging_dir):
+        entry_dir = self._entry_dir(key)
+        with self._lock:
+            if os.path.isdir(entry_dir):
+                shutil.rmtree(staging_dir, ignore_errors=True)
+            else:
+                os.rename(staging_dir, entry_dir)
+        self.evict()
+        return entry_dir
+
+    def entries(self):
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith(".") or not os.path.isdir(path):
+                continue
+            try:
+                entries.append((os.path.getmtime(path), _dir_size(path), path))
+            except OSError:
+                pass
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        with self._lock:
+            # Writes in progress take space too, but only whole entries can be evicted
+            staged = self.sweep_staging()
+            entries = sorted(self.entries())
+            total = staged + sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+                logging.info(f"Evicted cache entry {os.path.basename(path)} ({size} bytes)")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "bytes": self.size(),
+                "max_bytes": self.max_bytes,
+            }
+
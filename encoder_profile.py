@@ -0,0 +1,167 @@
+import os
+import sys
+import json
+import time
+import logging
+import subprocess
+from multiprocessing import cpu_count
+from disk_cache import CACHE_DIR
+
+CALIBRATION_PATH = os.environ.get("ENCODER_CALIBRATION_PATH", os.path.join(CACHE_DIR, "encoder_calibration.json"))
+# Render wall-clock budget as a multiple of the media duration (1.0 = no slower than real time)
+RENDER_TARGET_RATIO = float(os.environ.get("RENDER_TARGET_RATIO", 1.0))
+# Keep some headroom between the estimate and the budget
+BUDGET_SAFETY = 0.8
+# Fixed preset and CRF instead of the adaptive choice, e.g. for reproducible benchmarks
+RENDER_PRESET = os.environ.get("RENDER_PRESET") or None
+RENDER_CRF = int(os.environ["RENDER_CRF"]) if os.environ.get("RENDER_CRF") else None
+
+# Fastest first; slower presets compress better at the same CRF
+PRESETS = ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium"]
+
+# Rough x264 throughput in pixels per second per thread, used until this host is calibrated
+DEFAULT_PIXEL_RATES = {
+    "ultrafast": 30_000_000,
+    "superfast": 18_000_000,
+    "veryfast": 12_000_000,
+    "faster": 8_000_000,
+    "fast": 6_000_000,
+    "medium": 4_500_000,
+}
+
+CALIBRATION_SIZE = (1280, 720)
+CALIBRATION_RATE = 30
+CALIBRATION_SECONDS = 4
+
+def calibrate(presets=PRESETS, threads=None, path=CALIBRATION_PATH):
+    """Measure this host's libx264 throughput for each preset on a synthetic clip."""
+    threads = threads or cpu_count()
+    width, height = CALIBRATION_SIZE
+    frames = CALIBRATION_RATE * CALIBRATION_SECONDS
+    rates = {}
+    for preset in presets:
+        cmd = [
+            'ffmpeg', '-v', 'error', '-nostats',
+            '-f', 'lavfi', '-i', f"testsrc2=size={width}x{height}:rate={CALIBRATION_RATE}",
+            '-frames:v', str(frames),
+            '-c:v', 'libx264', '-preset', preset, '-crf', '23',
+            '-threads', str(threads),
+            '-f', 'null', '-'
+        ]
+        start_time = time.time()
+        subprocess.run(cmd, check=True)
+        elapsed = time.time() - start_time
+        rates[preset] = width * height * frames / elapsed / threads
+        logging.info(f"Calibrated {preset}: {frames / elapsed:.1f} fps with {threads} threads")
+
+    calibration = {"cpu_count": cpu_count(), "threads": threads, "pixel_rates": rates, "created": time.time()}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(calibration, f, indent=2)
+    return calibration
+
+_calibration = None
+
+def load_calibration(path=CALIBRATION_PATH):
+    global _calibration
+    if _calibration is None:
+        try:
+            with open(path, "r") as f:
+                calibration = json.load(f)
+            # A calibration from a different machine size does not describe this host
+            if calibration.get("cpu_count") != cpu_count():
+                raise ValueError("calibrated on a different core count")
+            _calibration = calibration["pixel_rates"]
+        except (OSError, ValueError, KeyError) as e:
+            logging.info(f"Using default encoder speed estimates ({str(e)})")
+            _calibration = dict(DEFAULT_PIXEL_RATES)
+    return _calibration
+
+def crf_for_height(height):
+    if height <= 480:
+        return 23
+    if height <= 720:
+        return 24
+    if height <= 1080:
+        return 26
+    return 28
+
+def _machine_contention():
+    # More runnable processes than cores slows every thread down proportionally
+    try:
+        load = os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return 1.0
+    return max(1.0, load / cpu_count())
+
+def select_profile(width, height, duration, fps=30.0, threads=None, budget=None):
+    """Pick preset, CRF and threading for an encode to finish within budget seconds.
+
+    Chooses the slowest (best compressing) preset whose estimated encode time
+    fits the budget, using calibrated per-thread throughput scaled by the
+    threads available and the current machine load. When even ultrafast does
+    not fit, it is used with a higher CRF. RENDER_PRESET and RENDER_CRF,
+    when set, override the choice.
+    """
+    threads = threads or cpu_count()
+    if budget is None:
+        budget = duration * RENDER_TARGET_RATIO
+    rates = load_calibration()
+    contention = _machine_contention()
+    pixels = width * height * fps * duration
+
+    crf = crf_for_height(height)
+    chosen = None
+    estimates = {}
+    for preset in PRESETS:
+        rate = rates.get(preset) or DEFAULT_PIXEL_RATES[preset]
+        estimates[preset] = pixels / (rate * threads) * contention
+        if estimates[preset] <= budget * BUDGET_SAFETY:
+            chosen = preset
+    if chosen is None:
+        chosen = PRESETS[0]
+        crf += 4
+    if RENDER_PRESET:
+        if RENDER_PRESET not in estimates:
+            raise ValueError(f"Unknown RENDER_PRESET '{RENDER_PRESET}', choose from {', '.join(PRESETS)}")
+        chosen = RENDER_PRESET
+    if RENDER_CRF is not None:
+        crf = RENDER_CRF
+
+    return {
+        "preset": chosen,
+        "crf": crf,
+        "threads": threads,
+        "thread_type": select_thread_type(duration, threads),
+        "estimated_seconds": estimates[chosen],
+    }
+
+def select_thread_type(duration, threads):
+    # Frame threading adds latency of roughly one frame per thread; for short
+    # clips with many threads, slice threading finishes sooner.
+    if duration < 30 and threads >= 4:
+        return "slice"
+    return "frame"
+
+def quality_args(profile):
+    """Encoder arguments that decide the output, without the threading of one job."""
+    return [
+        '-c:v', 'libx264',
+        '-preset', profile["preset"],
+        '-crf', str(profile["crf"]),
+    ]
+
+def thread_args(threads, thread_type="frame"):
+    args = ['-threads', str(threads)]
+    if thread_type == "slice":
+        args += ['-x264-params', 'sliced-threads=1']
+    return args
+
+def encode_args(profile):
+    return quality_args(profile) + thread_args(profile["threads"], profile.get("thread_type"))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    result = calibrate(threads=threads)
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,178 @@
+import os
+import csv
+import json
+import time
+import hashlib
+import logging
+from video_processor import (
+    processes,
+    run_ffmpeg,
+    subtitle_style,
+    video_encoder_profile,
+)
+from encoder_profile import quality_args, select_thread_type, thread_args
+from subtitle_track import Cue, SubtitleTrack
+
+# Target segment length; the segment muxer cuts at the first keyframe after each multiple
+SEGMENT_SECONDS = float(os.environ.get("RENDER_SEGMENT_SECONDS", 10))
+MANIFEST_NAME = "manifest.json"
+
+def _source_signature(video_path):
+    stat = os.stat(video_path)
+    return {"path": os.path.abspath(video_path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+def _load_manifest(work_dir):
+    try:
+        with open(os.path.join(work_dir, MANIFEST_NAME), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _save_manifest(work_dir, manifest):
+    manifest_path = os.path.join(work_dir, MANIFEST_NAME)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+def split_into_segments(video_path, work_dir, segment_seconds=SEGMENT_SECONDS):
+    """Stream copy the source into keyframe-aligned segments, returning their time ranges."""
+    list_path = os.path.join(work_dir, "segments.csv")
+    cmd = [
+        'ffmpeg', '-y', '-i', video_path,
+        '-map', '0:v:0', '-map', '0:a?',
+        '-c', 'copy',
+        '-f', 'segment', '-segment_time', str(segment_seconds),
+        '-reset_timestamps', '1',
+        '-segment_list', list_path, '-segment_list_type', 'csv',
+        os.path.join(work_dir, "source_%04d.mp4")
+    ]
+    run_ffmpeg(cmd, label="Segment split")
+
+    segments = []
+    with open(list_path, newline='') as f:
+        for index, (filename, start, end) in enumerate(csv.reader(f)):
+            segments.append({
+                "index": index,
+                "start": float(start),
+                "end": float(end),
+                "source": os.path.join(work_dir, filename),
+                "rendered": os.path.join(work_dir, f"rendered_{index:04d}.mp4"),
+                "cues_hash": None,
+            })
+    return segments
+
+def segment_track(track, start, end):
+    # Cues overlapping the segment, shifted to segment-local time
+    return SubtitleTrack(Cue(max(0.0, cue.start - start), cue.end - start, cue.text) for cue in track.cues_between(start, end))
+
+def _cues_hash(track, style, encoder):
+    # Segments are only concat-compatible when encoded with the same settings,
+    # so a different encoder profile invalidates every segment
+    digest = hashlib.sha256(style.encode("utf-8"))
+    digest.update(" ".join(encoder).encode("utf-8"))
+    digest.update(track.to_srt().encode("utf-8"))
+    return digest.hexdigest()
+
+def _work_dir(output_path):
+    return os.path.join(os.path.dirname(os.path.abspath(output_path)), "segments")
+
+def segment_quality_args(video_path, output_path, work_dir=None):
+    """Preset and CRF of the existing segments of video_path, or None before the first render."""
+    manifest = _load_manifest(work_dir or _work_dir(output_path))
+    if manifest is None or manifest["source"] != _source_signature(video_path):
+        return None
+    return manifest.get("quality_args")
+
+def render_incremental(video_path, subtitle_file, output_path, font_color, bg_color, font_size, transparency,
+                       threads=None, timeout=None, on_progress=None, work_dir=None, encoder=None, media_duration=None):
+    """Burn subtitles segment by segment, re-encoding only segments whose cues or style changed.
+
+    The first render splits the source into keyframe-aligned segments and
+    remembers a hash of each segment's cues. Later renders re-encode only the
+    segments whose hash differs and reassemble the output with a stream-copy
+    concat. encoder, when given, is the preset and CRF to encode with; callers
+    keep the one from segment_quality_args for segments to be reused.
+    """
+    start_time = time.time()
+    deadline = start_time + timeout if timeout else None
+    work_dir = work_dir or _work_dir(output_path)
+    os.makedirs(work_dir, exist_ok=True)
+
+    manifest = _load_manifest(work_dir)
+    source = _source_signature(video_path)
+    if manifest is None or manifest["source"] != source:
+        manifest = {"source": source, "segments": split_into_segments(video_path, work_dir)}
+        _save_manifest(work_dir, manifest)
+
+    style = subtitle_style(font_color, bg_color, font_size, transparency)
+    track = SubtitleTrack.load(subtitle_file)
+    # Preset and CRF stay fixed for the segments' lifetime so they can be concatenated,
+    # a different one passed in re-encodes every segment; threading follows the cores of each job
+    threads = threads or processes
+    encoder = encoder or manifest.get("quality_args") or quality_args(video_encoder_profile(video_path, threads, timeout))
+    manifest["quality_args"] = encoder
+    source_duration = media_duration or (manifest["segments"][-1]["end"] if manifest["segments"] else 0.0)
+    threading_args = thread_args(threads, select_thread_type(source_duration, threads))
+
+    stale = []
+    for segment in manifest["segments"]:
+        local_track = segment_track(track, segment["start"], segment["end"])
+        cues_hash = _cues_hash(local_track, style, encoder)
+        if cues_hash != segment["cues_hash"] or not os.path.exists(segment["rendered"]):
+            stale.append((segment, local_track, cues_hash))
+    logging.info(f"Re-encoding {len(stale)} of {len(manifest['segments'])} segments")
+
+    total = sum(segment["end"] - segment["start"] for segment, _, _ in stale)
+    done = 0.0
+    for segment, local_track, cues_hash in stale:
+        segment_duration = segment["end"] - segment["start"]
+        segment_srt = local_track.save(os.path.join(work_dir, f"subtitles_{segment['index']:04d}.srt"))
+
+        def segment_progress(progress, offset=done):
+            if on_progress is None:
+                return
+            out_time = offset + (progress["out_time"] or 0.0)
+            progress = dict(progress, out_time=out_time, duration=total, elapsed=time.time() - start_time, done=False)
+            progress["percent"] = min(100.0, 100.0 * out_time / total) if total else None
+            progress["eta"] = (total - out_time) / progress["speed"] if progress["speed"] else None
+            on_progress(progress)
+
+        remaining = deadline - time.time() if deadline else None
+        partial_path = os.path.join(work_dir, f"rendered_{segment['index']:04d}.part.mp4")
+        cmd = [
+            'ffmpeg', '-y', '-i', segment["source"],
+            '-vf', f"subtitles={segment_srt}:force_style='{style}'",
+            *encoder, *threading_args,
+            '-c:a', 'copy',
+            partial_path
+        ]
+        run_ffmpeg(cmd, segment_duration, segment_progress, remaining, label=f"Segment {segment['index']} write")
+        os.replace(partial_path, segment["rendered"])
+        segment["cues_hash"] = cues_hash
+        _save_manifest(work_dir, manifest)
+        done += segment_duration
+
+    concat_list = os.path.join(work_dir, "concat.txt")
+    with open(concat_list, "w") as f:
+        for segment in manifest["segments"]:
+            f.write(f"file '{segment['rendered']}'\n")
+
+    base, ext = os.path.splitext(output_path)
+    partial_path = f"{base}.part{ext}"
+    cmd = [
+        'ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', concat_list,
+        '-c', 'copy', '-movflags', '+faststart',
+        partial_path
+    ]
+    try:
+        remaining = deadline - time.time() if deadline else None
+        run_ffmpeg(cmd, timeout=remaining, label="Segment concat")
+        os.replace(partial_path, output_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+    if on_progress is not None:
+        on_progress({"frame": None, "fps": None, "speed": None, "out_time": total, "duration": total,
+                     "elapsed": time.time() - start_time, "percent": 100.0, "eta": 0.0, "done": True})
+    logging.info(f"Incremental render completed in {time.time() - start_time:.2f} seconds")
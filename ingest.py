@@ -0,0 +1,81 @@
+import os
+import hashlib
+import logging
+import subprocess
+import threading
+from video_processor import probe_duration, probe_media
+
+INGEST_CHUNK_SIZE = int(os.environ.get("INGEST_CHUNK_SIZE", 1024 * 1024))
+# Probe once this much is on disk; MP4s with the moov atom up front are fully described by then
+PROBE_HEAD_BYTES = int(os.environ.get("INGEST_PROBE_HEAD_BYTES", 8 * 1024 * 1024))
+
+def iter_chunks(source, chunk_size=INGEST_CHUNK_SIZE):
+    """Yield chunks from an upload without materialising another full copy.
+
+    Objects exposing their buffer (Streamlit's UploadedFile, BytesIO) are
+    sliced through a memoryview; anything else is read chunk by chunk.
+    """
+    if hasattr(source, "getbuffer"):
+        view = source.getbuffer()
+        for offset in range(0, len(view), chunk_size):
+            yield view[offset:offset + chunk_size]
+        return
+
+    if hasattr(source, "seek"):
+        source.seek(0)
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+def _probe(path, probe=probe_media):
+    try:
+        return probe(path)
+    except (OSError, subprocess.CalledProcessError, ValueError, KeyError) as e:
+        logging.debug(f"Probe of {path} failed: {str(e)}")
+        return None
+
+def ingest_upload(source, dest_path, chunk_size=INGEST_CHUNK_SIZE):
+    """Write an upload to dest_path in chunks, hashing and probing it on the way.
+
+    Returns a dict with path, size, sha256 and ffprobe metadata, so later
+    stages do not have to read the file again. Codecs and resolution are
+    probed from the partial file as soon as PROBE_HEAD_BYTES are written; if
+    that fails (e.g. the MP4 index is at the end) the complete file is fully
+    probed once the write completes. The duration always comes from the
+    complete file, as ffprobe estimates it from the bytes present for
+    containers without a header duration (MPEG-TS, fragmented MP4).
+    """
+    digest = hashlib.sha256()
+    size = 0
+    probe_result = {}
+    probe_thread = None
+
+    with open(dest_path, "wb") as f:
+        for chunk in iter_chunks(source, chunk_size):
+            digest.update(chunk)
+            f.write(chunk)
+            size += len(chunk)
+            if probe_thread is None and size >= PROBE_HEAD_BYTES:
+                f.flush()
+                probe_thread = threading.Thread(target=lambda: probe_result.update(metadata=_probe(dest_path)), daemon=True)
+                probe_thread.start()
+
+    metadata = None
+    if probe_thread is not None:
+        probe_thread.join()
+        metadata = probe_result.get("metadata")
+    if metadata is None:
+        metadata = _probe(dest_path)
+    else:
+        # Only reads the container header, cheap even for large files
+        metadata["duration"] = _probe(dest_path, probe_duration)
+
+    logging.info(f"Ingested {size} bytes to {dest_path}")
+    return {
+        "path": dest_path,
+        "size": size,
+        "sha256": digest.hexdigest(),
+        "metadata": metadata,
+    }
@@ -1,15 +1,21 @@
-from numpy import ma
 import streamlit as st
 import os
-from datetime import time
-import tempfile
 import asyncio
 import logging
-from video_processor import extract_audio, add_subtitles_to_video
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from video_processor import format_progress, extract_audio, resolve_audio_profile, audio_path_for_profile, render_quality_args, PREVIEW_ENCODE_ARGS, PREVIEW_FPS, PREVIEW_MAX_HEIGHT
 from subtitle_generator import generate_subtitles
-from transcriber import transcribe_audio
+from subtitle_track import SubtitleTrack, format_timestamp
+from transcriber import transcribe_audio, transcribe_long_audio, transcribe_speech_only, transcribe_video_stream, LONG_MEDIA_THRESHOLD, PIPELINED_TRANSCRIPTION
+from vad import VAD_TRIM
+from transcription_cache import transcription_cache_key, load_transcription, store_transcription
+from ingest import ingest_upload
+from render_cache import normalize_style, render_cache_key, load_render, snapshot_subtitles
+from render_queue import submit_job, get_job, queue_status, ensure_worker_pool, active_job_paths, job_cores, QUEUED, RUNNING, DONE, RENDER_JOB_TIMEOUT
+from incremental_render import segment_quality_args
+from scratch import get_scratch_space
+from metrics import span, wait_for, file_size, start_metrics_server
 from streamlit_chunk_file_uploader import uploader
-import random
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -17,6 +23,10 @@ logger = logging.getLogger(__name__)
 
 st.set_page_config(page_title="Instagram Reel Transcriber", layout="wide")
 
+# Renders run on a process-wide worker pool shared by all sessions
+ensure_worker_pool()
+start_metrics_server()
+
 # Initialize session state
 if 'processed_video' not in st.session_state:
     st.session_state.processed_video = None
@@ -24,12 +34,29 @@ if 'transcription' not in st.session_state:
     st.session_state.transcription = None
 if 'subtitle_file' not in st.session_state:
     st.session_state.subtitle_file = None
+# Session files live in a shared scratch space with a global quota and idle expiry
+scratch = get_scratch_space()
+scratch.add_protector(active_job_paths)
+session_id = get_script_run_ctx().session_id
 if 'temp_dir' not in st.session_state:
-    st.session_state.temp_dir = tempfile.mkdtemp()
+    st.session_state.temp_dir = scratch.session_dir(session_id)
+elif not os.path.isdir(st.session_state.temp_dir):
+    # Expired or evicted while the user was away; ask for the video again
+    st.session_state.temp_dir = scratch.session_dir(session_id)
+    st.session_state.processed_video = None
+    st.session_state.transcription = None
+    st.session_state.subtitle_file = None
+scratch.touch(session_id)
 if 'temp_video_path' not in st.session_state:
     st.session_state.temp_video_path = None
 if 'temp_audio_path' not in st.session_state:
     st.session_state.temp_audio_path = None
+if 'audio_profile' not in st.session_state:
+    st.session_state.audio_profile = None
+if 'media_hash' not in st.session_state:
+    st.session_state.media_hash = None
+if 'media_metadata' not in st.session_state:
+    st.session_state.media_metadata = {}
 if 'language' not in st.session_state:
     st.session_state.language = 'fi'
 if 'model' not in st.session_state:
@@ -38,66 +65,117 @@ if 'video_duration' not in st.session_state:
     st.session_state.video_duration = 90
 if 'output_video_path' not in st.session_state:
     st.session_state.output_video_path = None
-if 'processing_completed' not in st.session_state:
-        st.session_state.processing_completed = False
-if 'can_process' not in st.session_state:
-    st.session_state.can_process = True
 if 'video_ready' not in st.session_state:
     st.session_state.video_ready = False
-if 'temp_audio_file' not in st.session_state:
-    st.session_state.temp_audio_file = str(random.randint(1000, 10000))+".mp3"
 
-async def process_video(temp_video_path, temp_audio_path, temp_dir, progress_bar):
+def streamlit_progress(progress_bar, start, end, label):
+    # ffmpeg progress arrives on other threads (to_thread workers, the transcription client's
+    # loop); widgets are updated from this script run's event loop, which has its context
+    loop = asyncio.get_running_loop()
+
+    def update(progress):
+        progress_bar.progress(start + (end - start) * progress["percent"] / 100, text=f"{label}: {format_progress(progress)}")
+
+    def on_progress(progress):
+        if progress["percent"] is None:
+            return
+        try:
+            loop.call_soon_threadsafe(update, progress)
+        except RuntimeError:
+            # The script run has ended
+            pass
+
+    return on_progress
+
+async def process_video(temp_video_path, temp_audio_path, temp_dir, progress_bar, audio_profile=None, media_hash=None, media_duration=None):
     try:
-        transcription = None
-        subtitle_file = None
-        duration = None
-
-        # Extract audio if not already done
-        if not os.path.exists(temp_audio_path):
-            progress_bar.progress(0.1)
-            with st.spinner("Extracting audio..."):
-                await asyncio.to_thread(extract_audio, temp_video_path, temp_audio_path)
-            progress_bar.progress(0.3)
-            st.success("Audio extraction complete!")
-            logger.info("Audio extraction completed successfully")
-
-        # Transcribe audio if not already done
-        if transcription is None:
-            progress_bar.progress(0.4)
-            with st.spinner("Transcribing audio..."):
-                transcription_task = asyncio.create_task(transcribe_audio(temp_audio_path,st.session_state.language,st.session_state.model))
-                try:
-                    transcription, duration = await asyncio.wait_for(transcription_task, timeout=300)  # 5-minute timeout
-                    logger.info("Transcription completed successfully")
-                except asyncio.TimeoutError:
-                    logger.warning("Transcription timed out after 300 seconds")
-                    transcription_task.cancel()
+        with span("process_video", model=st.session_state.model, language=st.session_state.language) as process_span:
+            transcription = None
+            subtitle_file = None
+            duration = None
+            cache_key = None
+            long_media = media_duration is not None and media_duration > LONG_MEDIA_THRESHOLD
+            # Short media is extracted and uploaded in one overlapping pipeline, without an audio file
+            pipelined = PIPELINED_TRANSCRIPTION and not long_media and not VAD_TRIM
+            process_span.set(bytes_in=file_size(temp_video_path), media_duration=media_duration,
+                             mode="speech_only" if VAD_TRIM else "long" if long_media else "pipelined" if pipelined else "file")
+
+            # Reuse a previous transcription of the same media, skipping extraction and the API call
+            if media_hash is not None:
+                cache_key = transcription_cache_key(media_hash, st.session_state.language, st.session_state.model, audio_profile, VAD_TRIM)
+                cached = await asyncio.to_thread(load_transcription, cache_key)
+                process_span.set(cache_hit=cached is not None)
+                if cached is not None:
+                    transcription, duration = cached
+                    progress_bar.progress(0.7)
+                    st.success("Transcription loaded from cache!")
+
+            # Extract audio if not already done
+            if transcription is None and not pipelined and not VAD_TRIM and not os.path.exists(temp_audio_path):
+                progress_bar.progress(0.1)
+                with st.spinner("Extracting audio..."):
+                    await asyncio.to_thread(extract_audio, temp_video_path, temp_audio_path, audio_profile,
+                                            streamlit_progress(progress_bar, 0.1, 0.3, "Extracting audio"), media_duration)
+                progress_bar.progress(0.3)
+                st.success("Audio extraction complete!")
+                logger.info("Audio extraction completed successfully")
+
+            # Transcribe audio if not already done
+            if transcription is None:
+                progress_bar.progress(0.4)
+                # Long media is split at silences and transcribed in concurrent chunks,
+                # each chunk has its own request timeout and retries
+                if VAD_TRIM:
+                    # Only detected speech is uploaded, timestamps are mapped back to the source
+                    transcription_coro = transcribe_speech_only(temp_video_path, temp_dir, st.session_state.language, st.session_state.model, audio_profile, media_duration)
+                    timeout = None if long_media else 300
+                elif long_media:
+                    transcription_coro = transcribe_long_audio(temp_audio_path, st.session_state.language, st.session_state.model, audio_profile)
+                    timeout = None
+                elif pipelined:
+                    transcription_coro = transcribe_video_stream(temp_video_path, st.session_state.language, st.session_state.model, audio_profile,
+                                                                 media_duration, streamlit_progress(progress_bar, 0.4, 0.7, "Transcribing"))
+                    timeout = 300  # 5-minute timeout
+                else:
+                    transcription_coro = transcribe_audio(temp_audio_path, st.session_state.language, st.session_state.model)
+                    timeout = 300  # 5-minute timeout
+                with st.spinner("Transcribing audio..." if not long_media else "Transcribing long audio in chunks..."):
                     try:
-                        await transcription_task
-                    except asyncio.CancelledError:
-                        logger.error("Transcription task cancelled due to timeout")
+                        # Cancels the transcription on timeout; its span is recorded as a timeout of that stage
+                        transcription, duration = await wait_for(transcription_coro, timeout)
+                        logger.info("Transcription completed successfully")
+                    except asyncio.TimeoutError:
+                        logger.error(f"Transcription timed out after {timeout} seconds and was cancelled")
+                        process_span.set(timed_out=True)
                         st.error("Transcription timed out. Please try again with a shorter video.")
-                        return None, None
-            progress_bar.progress(0.7)
-            st.success("Transcription complete!")
-
-        # Generate subtitles
-        if subtitle_file is None:
-            progress_bar.progress(0.8)
-            with st.spinner("Generating subtitles..."):
-                subtitle_file = await asyncio.to_thread(generate_subtitles, transcription, temp_dir)
-            st.success("Subtitles generated!")
-            logger.info("Subtitles generated successfully")
-
-        return transcription, subtitle_file, duration
+                        return None, None, None
+                progress_bar.progress(0.7)
+                st.success("Transcription complete!")
+                if cache_key is not None:
+                    # A cache failure must not cost the user a transcription that succeeded
+                    try:
+                        await asyncio.to_thread(store_transcription, cache_key, transcription, duration)
+                    except OSError as e:
+                        logger.warning(f"Could not cache transcription: {str(e)}")
+
+            # Generate subtitles
+            if subtitle_file is None:
+                progress_bar.progress(0.8)
+                with st.spinner("Generating subtitles..."):
+                    subtitle_file = await asyncio.to_thread(generate_subtitles, transcription, temp_dir)
+                st.success("Subtitles generated!")
+                logger.info("Subtitles generated successfully")
+
+            return transcription, subtitle_file, duration
     except Exception as e:
         logger.error(f"Error during video processing: {str(e)}", exc_info=True)
         st.error(f"Error during video processing: {str(e)}")
-        return None, None
+        return None, None, None
 
 async def main():
     st.title("Video transcriber and subtitle generator")
+    usage = scratch.usage()
+    st.sidebar.caption(f"Scratch space: {usage['bytes'] / 1e6:.0f} / {usage['quota_bytes'] / 1e6:.0f} MB in {usage['sessions']} session(s)")
     language = st.text_input("Language for transcription: ", "fi",max_chars=4)
     model = st.selectbox("Select model:", ["whisper-large","whisper-medium","whisper-tiny","nova-2"])
     if st.session_state.language != language:
@@ -114,124 +192,97 @@ async def main():
             st.session_state.processed_video = uploaded_file
             st.session_state.transcription = None
             st.session_state.subtitle_file = None
-            st.session_state.can_process = False
-            st.session_state.can_process = True
             st.session_state.video_ready = False
-            st.session_state.last_file_size = None
+            st.session_state.render_job_id = None
+            st.session_state.preview_ready = False
+            st.session_state.preview_job_id = None
             st.session_state.processing_status = ""
-            st.session_state.temp_audio_file = str(random.randint(1000, 10000))+".mp3"
 
-            # Save uploaded file temporarily
-            if st.session_state.temp_dir:
-                for file in os.listdir(st.session_state.temp_dir):
-                    os.remove(os.path.join(st.session_state.temp_dir, file))
-            else:
-                st.session_state.temp_dir = tempfile.mkdtemp()
+            # Save uploaded file temporarily, in a fresh directory as render jobs may still read the previous upload
+            scratch.clear_session(session_id)
+            st.session_state.temp_dir = scratch.upload_dir(session_id)
 
-            st.session_state.temp_video_path = os.path.join(st.session_state.temp_dir, "input_video.mp4")
-            with open(st.session_state.temp_video_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
+            st.session_state.temp_video_path = scratch.register(session_id, os.path.join(st.session_state.temp_dir, "input_video.mp4"), "input")
+            # Write in chunks, hashing and probing on the way so later stages reuse the results
+            ingested = await asyncio.to_thread(ingest_upload, uploaded_file, st.session_state.temp_video_path)
+            st.session_state.media_hash = ingested["sha256"]
+            st.session_state.media_metadata = ingested["metadata"] or {}
+            media_duration = st.session_state.media_metadata.get("duration")
+            if media_duration is None:
+                logger.warning("Could not probe media duration")
 
             # Extract audio
-            st.session_state.temp_audio_path = os.path.join(st.session_state.temp_dir, "audio.wav")
+            st.session_state.audio_profile = resolve_audio_profile(st.session_state.temp_video_path,
+                                                                   audio_codec=st.session_state.media_metadata.get("audio_codec"))
+            st.session_state.temp_audio_path = scratch.register(session_id, audio_path_for_profile(st.session_state.temp_dir, st.session_state.audio_profile), "audio")
 
             # Process video
             progress_bar = st.progress(0)
-            st.session_state.transcription, st.session_state.subtitle_file,duration = await process_video(
-                st.session_state.temp_video_path, 
-                st.session_state.temp_audio_path, 
-                st.session_state.temp_dir, 
-                progress_bar
-            )
+            with scratch.in_use(st.session_state.temp_dir):
+                st.session_state.transcription, st.session_state.subtitle_file,duration = await process_video(
+                    st.session_state.temp_video_path, 
+                    st.session_state.temp_audio_path, 
+                    st.session_state.temp_dir, 
+                    progress_bar,
+                    st.session_state.audio_profile,
+                    st.session_state.media_hash,
+                    media_duration
+                )
+            if st.session_state.subtitle_file is not None:
+                scratch.register(session_id, st.session_state.subtitle_file, "subtitles")
+            scratch.enforce()
             if st.session_state.video_duration != duration:
                 st.session_state.video_duration = duration
 
-        def load_subtitles(file_path):
-            with open(file_path, 'r') as f:
-                content = f.read().strip().split('\n\n')
-
-            subtitles = []
-            for subtitle in content:
-                lines = subtitle.split('\n')
-                if len(lines) >= 3:
-                    index = int(lines[0].strip())
-                    timecode = lines[1].strip()
-                    text = ' '.join(lines[2:])
-                    start, end = timecode.split(' --> ')
-                    subtitles.append((index, start, end, text))
-            return subtitles
-
-        def format_time_str(seconds):
-            hours = int(seconds // 3600)
-            minutes = int((seconds % 3600) // 60)
-            seconds = seconds % 60
-            return f"{hours:02}:{minutes:02}:{seconds:06.3f}"
-
-        def time_to_seconds(time_str):
-            h, m, s = time_str.split(':')
-            return int(h) * 3600 + int(m) * 60 + float(s)
-
-        def save_subtitles(file_path, subtitles):
-            with open(file_path, 'w') as f:
-                for index, start, end, text in subtitles:
-                    f.write(f"{index}\n{start} --> {end}\n{text}\n\n")
-
-
-
-
+        def load_track(file_path):
+            # Parse once per version of the file instead of on every rerun
+            version = (file_path, os.path.getmtime(file_path))
+            cached = st.session_state.get('subtitle_track_cache')
+            if cached is None or cached[0] != version:
+                track = SubtitleTrack.load(file_path)
+                cached = (version, track, track.to_srt())
+                st.session_state.subtitle_track_cache = cached
+            return cached[1], cached[2]
 
         # Assuming subtitle contents are loaded into st.session_state.subtitle_file
         if st.session_state.transcription is not None and st.session_state.subtitle_file is not None:
             # Load subtitles
-            subtitles = load_subtitles(st.session_state.subtitle_file)
+            track, current_content = load_track(st.session_state.subtitle_file)
 
             st.subheader('Adjust Subtitles')
-            edited_subtitles = []
-            
-            # Create raw subtitle content for editing
-            current_content = ""
-            for index, start, end, text in subtitles:
-                current_content += f"{index}\n{start} --> {end}\n{text}\n\n"
-            
+
             # Add expander for raw subtitle editing
             with st.expander("Edit Subtitles"):
                 edited_content = st.text_area("Edit subtitles directly", current_content, height=300)
-                
-                # Parse the edited content
-                try:
-                    edited_blocks = edited_content.strip().split('\n\n')
-                    for block in edited_blocks:
-                        lines = block.strip().split('\n')
-                        if len(lines) >= 3:
-                            index = int(lines[0].strip())
-                            timecode = lines[1].strip()
-                            text = '\n'.join(lines[2:])
-                            start, end = timecode.split(' --> ')
-                            edited_subtitles.append((index, start, end, text))
-                            
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        if st.button("Save Changes"):
-                            save_subtitles(st.session_state.subtitle_file, edited_subtitles)
-                            st.session_state.last_file_size = None  # Force video regeneration
-                            st.session_state.video_ready = False
-                            st.success("Subtitles saved successfully.")
-                            st.rerun()  # Reload the page to reflect changes
-                    
-                    with col2:
-                        with open(st.session_state.subtitle_file, "rb") as file:
-                            st.download_button(
-                                label="Download Subtitles (.srt)",
-                                data=file,
-                                file_name="subtitles.srt",
-                                mime="text/plain"
-                            )
-                except Exception as e:
-                    st.error("Error parsing subtitle format. Please ensure correct format: index, timecode, text")
-
-
-
 
+                # Parse the edited content; saving is disabled until it parses, so no cue is dropped
+                edited_track = track
+                if edited_content != current_content:
+                    try:
+                        edited_track = SubtitleTrack.from_srt(edited_content)
+                    except ValueError as e:
+                        edited_track = None
+                        st.error(f"Error parsing subtitle format: {str(e)}. Please ensure correct format: index, timecode, text")
+                    else:
+                        changed = track.diff(edited_track)
+                        if changed:
+                            st.caption(f"{len(changed)} changed span(s), first at {format_timestamp(changed[0][0])}")
+
+                col1, col2 = st.columns(2)
+                with col1:
+                    if st.button("Save Changes", disabled=edited_track is None):
+                        edited_track.save(st.session_state.subtitle_file)
+                        st.session_state.video_ready = False
+                        st.success("Subtitles saved successfully.")
+                        st.rerun()  # Reload the page to reflect changes
+
+                with col2:
+                    st.download_button(
+                        label="Download Subtitles (.srt)",
+                        data=current_content,
+                        file_name="subtitles.srt",
+                        mime="text/plain"
+                    )
 
             # Subtitle customization
             st.subheader("Customize Subtitles")
@@ -239,112 +290,144 @@ async def main():
             bg_color = st.color_picker("Background Color", "#000000")
             font_size = st.slider("Font Size", 5, 50, 10)
             transparency = st.slider("Background Transparency", 0, 100, 70)
+            output_mode = st.radio("Output", ["Burned-in", "Soft (selectable subtitle track)"], horizontal=True)
+            soft_output = output_mode != "Burned-in"
+            if soft_output:
+                soft_container = st.selectbox("Container", ["MP4 (mov_text)", "MKV (ASS, full styling)"])
+                output_ext = ".mkv" if soft_container.startswith("MKV") else ".mp4"
+            else:
+                output_ext = ".mp4"
+                incremental = st.checkbox("Incremental re-render (only re-encode parts with changed subtitles)", value=True)
+
+            # Preview range
+            st.subheader("Quick Preview")
+            preview_range = st.radio("Preview range", ["First 15 seconds", "Around a subtitle", "Whole video"], horizontal=True)
+            preview_start, preview_duration = 0.0, 15.0
+            if preview_range == "Around a subtitle" and len(track):
+                cue_index = st.selectbox("Subtitle", range(len(track)), format_func=lambda i: f"{i + 1}: {track.texts[i][:60]}")
+                preview_start = max(0.0, track.starts[cue_index] - 2.0)
+                preview_duration = track.ends[cue_index] + 2.0 - preview_start
+            elif preview_range == "Whole video":
+                preview_start, preview_duration = None, None
 
             # Initialize states
-            if 'can_process' not in st.session_state:
-                st.session_state.can_process = True
-            if 'last_file_size' not in st.session_state:
-                st.session_state.last_file_size = None
             if 'processing_status' not in st.session_state:
                 st.session_state.processing_status = ""
+            if 'render_job_id' not in st.session_state:
+                st.session_state.render_job_id = None
+            if 'preview_job_id' not in st.session_state:
+                st.session_state.preview_job_id = None
+            if 'preview_ready' not in st.session_state:
+                st.session_state.preview_ready = False
 
             # Create status containers
             status_container = st.empty()
             preview_container = st.container()
 
-            @st.fragment(run_every=3)
-            def check_video_status(temp_filename):
-                output_video_path = os.path.join(st.session_state.temp_dir, "output_video.mp4")
-                
-                if os.path.exists(output_video_path):
-                    current_size = os.path.getsize(output_video_path)
+            output_video_path = scratch.register(session_id, os.path.join(st.session_state.temp_dir, f"output_video{output_ext}"), "output")
+            preview_video_path = scratch.register(session_id, os.path.join(st.session_state.temp_dir, "preview_video.mp4"), "preview")
+            scratch.register(session_id, os.path.join(st.session_state.temp_dir, "segments"), "segments")
+            style_params = {
+                "video_path": st.session_state.temp_video_path,
+                # Probed at ingest, so render jobs do not probe the input again
+                "media_duration": st.session_state.media_metadata.get("duration"),
+                "subtitle_file": st.session_state.subtitle_file,
+                "font_color": font_color,
+                "bg_color": bg_color,
+                "font_size": font_size,
+                "transparency": transparency,
+            }
+
+            # (job id key, ready flag key, label) of the render jobs a session can have running
+            render_slots = (
+                ("render_job_id", "video_ready", "Video processing"),
+                ("preview_job_id", "preview_ready", "Preview"),
+            )
 
-                    # If size changed or processing just completed
-                    if st.session_state.last_file_size != current_size or st.session_state.processing_completed:
-                        st.session_state.last_file_size = current_size
-                        st.session_state.processing_completed = False
-                        output_temp_audiofile_path = os.path.join(os.getcwd(), st.session_state.temp_audio_file)
+            @st.fragment(run_every=3)
+            def check_video_status():
+                for job_key, ready_key, label in render_slots:
+                    job_id = st.session_state[job_key]
+                    if job_id is None:
+                        continue
+                    job = get_job(job_id)
+                    if job is None:
+                        continue
+                    if job["status"] == RUNNING and job["progress"] and job["progress"]["percent"] is not None:
+                        st.progress(job["progress"]["percent"] / 100, text=f"{label}: {format_progress(job['progress'])}")
+                    if job["status"] in (QUEUED, RUNNING):
+                        continue
+
+                    # Job finished since the last check
+                    st.session_state[job_key] = None
+                    if job["status"] == DONE:
+                        st.session_state.processing_status = f"{label} complete!"
+                        st.session_state[ready_key] = True
+                        logger.info(f"{label} completed successfully")
+                    else:
+                        st.session_state.processing_status = f"Error during {label.lower()}: {job['error']}"
+                        logger.error(f"Error during {label.lower()}: {job['error']}")
+                    st.rerun()
 
-                        if not os.path.exists(output_temp_audiofile_path):
-                            st.session_state.processing_status = "Video processing complete!"
-                            st.rerun()
-                    return True
-                return False
-                
+            style = normalize_style(font_color, bg_color, font_size, transparency)
 
-            # Initialize generate state
-            if 'generate_video' not in st.session_state:
-                st.session_state.generate_video = False
+            def job_subtitles():
+                # Jobs render a snapshot, so saving edits meanwhile cannot change what is cached under their key
+                subtitle_file = snapshot_subtitles(st.session_state.subtitle_file, st.session_state.temp_dir)
+                return scratch.register(session_id, subtitle_file, "subtitles")
 
             def trigger_generation():
-                st.session_state.generate_video = True
-                st.session_state.can_process = False
                 st.session_state.video_ready = False
-                st.session_state.last_file_size = None
-
-            # Generate button
-
-            st.button("Generate/Regenerate Video", key="generate_button", on_click=trigger_generation)
-
-            # Handle video generation based on state
-            if st.session_state.generate_video and not st.session_state.can_process:
-                output_video_path = os.path.join(st.session_state.temp_dir, "output_video.mp4")
-                if not os.path.exists(st.session_state.temp_audio_file):
-                    st.session_state.temp_audio_file = str(random.randint(1000, 10000)) + ".mp3"
-                    
-                output_temp_audiofile_path = os.path.join(os.getcwd(), st.session_state.temp_audio_file)
-
-                # Check if video needs to be generated
-                needs_processing = True
-                if os.path.exists(output_video_path):
-                    current_size = os.path.getsize(output_video_path)
-
-                    if os.path.exists(output_temp_audiofile_path):
-                        print("temp_file_exists")
-                        needs_processing = False
-
-                    if st.session_state.last_file_size == current_size:
-                        print("Video already generated")
-                        needs_processing = False
-                
-                if needs_processing:
-                    st.session_state.processing_status = "Processing video..."
-                    status_placeholder = st.empty()
-                    status_placeholder.info("Processing video... This might take a while..")
-                    progress_bar = st.progress(0)
-                    progress_bar.progress(0.9)
-                    st.session_state.processing_completed = False
-
-                    
-                    try:
-                        await asyncio.wait_for(
-                            asyncio.to_thread(add_subtitles_to_video, 
-                                st.session_state.temp_video_path, 
-                                st.session_state.subtitle_file, 
-                                output_video_path, 
-                                font_color, 
-                                bg_color, 
-                                font_size, 
-                                transparency,
-                                output_temp_audiofile_path),
-                            timeout=600
-                        )
-                        progress_bar.progress(1.0)
-                        st.session_state.processing_status = "Video processing complete!"
-                        st.session_state.last_file_size = os.path.getsize(output_video_path)
-                        st.session_state.video_ready = True
-                        st.session_state.processing_completed = True
-                        logger.info("Video processing completed successfully")
-                    except asyncio.TimeoutError:
-                        st.session_state.processing_status = "Video processing timed out. Try with a smaller video."
-                        logger.error("Video processing timed out")
-                    except Exception as e:
-                        st.session_state.processing_status = f"Error during video processing: {str(e)}"
-                        logger.error(f"Error during video processing: {str(e)}")                    
-                    st.session_state.generate_video = False
-                    st.session_state.can_process = True
+                mode = f"soft{output_ext}" if soft_output else "full"
+                params = dict(style_params, subtitle_file=job_subtitles(), output_path=output_video_path)
+                if soft_output:
+                    # Stream copy only, one core is plenty
+                    kind, cores = "soft", 1
+                else:
+                    kind, cores = ("incremental" if incremental else "burn"), job_cores()
+                    # Incremental renders keep the preset and CRF of their existing segments
+                    params["encoder"] = ((incremental and segment_quality_args(st.session_state.temp_video_path, output_video_path))
+                                         or render_quality_args(st.session_state.temp_video_path, cores, RENDER_JOB_TIMEOUT, st.session_state.media_metadata))
+                cache_key = render_cache_key(st.session_state.media_hash, params["subtitle_file"], style, mode, encoder=params.get("encoder"))
+                if load_render(cache_key, output_video_path):
                     st.session_state.video_ready = True
-                    st.rerun()
+                    st.session_state.processing_status = "Video processing complete! (cached)"
+                    return
+                st.session_state.render_job_id = submit_job(kind, params, cores=cores, cache_key=cache_key)
+                st.session_state.processing_status = "Processing video... This might take a while.."
+
+            def trigger_preview():
+                st.session_state.preview_ready = False
+                params = dict(style_params, subtitle_file=job_subtitles(), output_path=preview_video_path,
+                              start=preview_start, duration=preview_duration)
+                cache_key = render_cache_key(st.session_state.media_hash, params["subtitle_file"], style, "preview",
+                                             start=preview_start, duration=preview_duration,
+                                             encoder=PREVIEW_ENCODE_ARGS, max_height=PREVIEW_MAX_HEIGHT, fps=PREVIEW_FPS)
+                if load_render(cache_key, preview_video_path):
+                    st.session_state.preview_ready = True
+                    st.session_state.processing_status = "Preview complete! (cached)"
+                    return
+                st.session_state.preview_job_id = submit_job("preview", params, cache_key=cache_key)
+                st.session_state.processing_status = "Rendering preview..."
+
+            # Preview renders are cheap, the full render only runs on explicit request
+            col1, col2 = st.columns(2)
+            with col1:
+                st.button("Render Preview", key="preview_button", on_click=trigger_preview,
+                          disabled=st.session_state.preview_job_id is not None)
+            with col2:
+                st.button("Generate/Regenerate Video", key="generate_button", on_click=trigger_generation,
+                          disabled=st.session_state.render_job_id is not None)
+
+            for job_key, _, label in render_slots:
+                if st.session_state[job_key] is None:
+                    continue
+                job = get_job(st.session_state[job_key])
+                if job is not None and job["status"] == QUEUED:
+                    load = queue_status()
+                    st.session_state.processing_status = f"{label}: waiting for a render slot ({load['busy_cores']}/{load['total_cores']} cores busy)..."
+                elif job is not None and job["status"] == RUNNING:
+                    st.session_state.processing_status = f"{label} in progress... This might take a while.."
 
             # Update status message
             with status_container:
@@ -357,23 +440,25 @@ async def main():
                         st.info(st.session_state.processing_status)
 
             # Show video preview and download button if video is ready
-            is_ready = check_video_status(st.session_state.temp_audio_file)
-            if is_ready or st.session_state.video_ready:
-                print("video preview ready")
-                output_video_path = os.path.join(st.session_state.temp_dir, "output_video.mp4")
+            check_video_status()
+            if st.session_state.preview_ready and os.path.exists(preview_video_path):
+                with preview_container:
+                    st.subheader("Style Preview (low resolution)")
+                    st.video(preview_video_path)
+            if st.session_state.video_ready:
                 if os.path.exists(output_video_path):
-                    print("video file exists")
                     with preview_container:
                         st.empty()  # Clear previous content
-                        st.subheader("Video Preview")
-                        st.video(output_video_path)
+                        if output_ext == ".mp4":
+                            st.subheader("Video Preview")
+                            st.video(output_video_path)
 
                         with open(output_video_path, "rb") as file:
                             st.download_button(
                                 label="Download Video with Subtitles",
                                 data=file,
-                                file_name="subtitled_video.mp4",
-                                mime="video/mp4"
+                                file_name=f"subtitled_video{output_ext}",
+                                mime="video/x-matroska" if output_ext == ".mkv" else "video/mp4"
                             )
 
 if __name__ == "__main__":
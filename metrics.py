@@ -0,0 +1,313 @@
+"""In-process metrics and tracing for the transcription and render pipeline.
+
+Stages are wrapped in spans (the traced decorator or the span context
+manager). A finished span adds its duration to the stage_duration_seconds
+histogram, counts failures and timeouts, adds any bytes_in/bytes_out it
+recorded, and is appended to a JSONL trace file. Spans inherit the model and
+language labels of the span they run in, including across asyncio.to_thread.
+
+Metrics are served in the Prometheus text format on METRICS_HOST:METRICS_PORT.
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import functools
+import threading
+import contextvars
+import subprocess
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from disk_cache import CACHE_DIR
+
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+# Set to 0 to disable the HTTP endpoint
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 9464))
+# Set to an empty string to disable tracing
+TRACE_FILE = os.environ.get("TRACE_FILE", os.path.join(CACHE_DIR, "traces.jsonl"))
+# The trace file is rotated to <TRACE_FILE>.1 above this size
+TRACE_MAX_BYTES = int(os.environ.get("TRACE_MAX_BYTES", 50 * 1024 * 1024))
+
+# Span attributes that become metric labels and are inherited by child spans
+LABEL_KEYS = ("model", "language")
+
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+REGISTRY = []
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple((name, labels.get(name) or "") for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return lines
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(key)} {value}" for key, value in self._values.items()]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            # [per-bucket counts, sum, count]
+            state = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self):
+        lines = []
+        for key, (counts, total, count) in self._values.items():
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bound),))} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+STAGE_LABELS = ("stage", "model", "language")
+
+stage_duration = Histogram("stage_duration_seconds", "Wall time of pipeline stages", STAGE_LABELS + ("status",))
+stage_failures = Counter("stage_failures_total", "Pipeline stages that raised", STAGE_LABELS + ("error",))
+stage_timeouts = Counter("stage_timeouts_total", "Pipeline stages that timed out", STAGE_LABELS)
+stage_bytes = Counter("stage_bytes_total", "Bytes read and written by pipeline stages", STAGE_LABELS + ("direction",))
+cache_requests = Counter("cache_requests_total", "Cache lookups by result", ("cache", "result"))
+queue_wait = Histogram("queue_wait_seconds", "Time spent waiting for a worker slot", ("queue", "kind"))
+
+def render_prometheus():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+_trace_lock = threading.Lock()
+
+def _write_trace(record):
+    if not TRACE_FILE:
+        return
+    line = json.dumps(record, default=str) + "\n"
+    try:
+        with _trace_lock:
+            os.makedirs(os.path.dirname(os.path.abspath(TRACE_FILE)), exist_ok=True)
+            if os.path.exists(TRACE_FILE) and os.path.getsize(TRACE_FILE) > TRACE_MAX_BYTES:
+                os.replace(TRACE_FILE, TRACE_FILE + ".1")
+            with open(TRACE_FILE, "a") as f:
+                f.write(line)
+    except OSError as e:
+        logging.warning(f"Could not write trace record: {str(e)}")
+
+# Set by wait_for in the context of the task it runs, so spans inside can tell its timeout from other cancellation
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+def _status(error):
+    if error is None:
+        return "ok"
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, subprocess.TimeoutExpired)):
+        return "timeout"
+    if isinstance(error, asyncio.CancelledError):
+        deadline = _deadline.get()
+        if deadline is not None and deadline["expired"]:
+            return "timeout"
+        # A closed session or shutdown, not a failure of the stage
+        return "cancelled"
+    return "error"
+
+class Span:
+    def __init__(self, name, parent=None, **attributes):
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = {key: parent.attributes[key] for key in LABEL_KEYS if parent is not None and key in parent.attributes}
+        self.set(**attributes)
+        self.start = time.time()
+        self._start = time.perf_counter()
+
+    def set(self, **attributes):
+        self.attributes.update((key, value) for key, value in attributes.items() if value is not None)
+
+    def labels(self):
+        return {"stage": self.name, **{key: self.attributes.get(key) for key in LABEL_KEYS}}
+
+    def finish(self, error=None):
+        duration = time.perf_counter() - self._start
+        labels = self.labels()
+        status = _status(error)
+        if status in ("error", "timeout"):
+            error_name = "TimeoutError" if isinstance(error, asyncio.CancelledError) else type(error).__name__
+            stage_failures.inc(**labels, error=error_name)
+        if status == "timeout":
+            stage_timeouts.inc(**labels)
+        stage_duration.observe(duration, **labels, status=status)
+        for direction in ("in", "out"):
+            if self.attributes.get(f"bytes_{direction}"):
+                stage_bytes.inc(self.attributes[f"bytes_{direction}"], **labels, direction=direction)
+
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration": duration,
+            "status": status,
+            "pid": os.getpid(),
+            "attributes": self.attributes,
+        }
+        if error is not None:
+            record["error"] = f"{type(error).__name__}: {str(error)}"
+        _write_trace(record)
+
+class _NoSpan:
+    def set(self, **attributes):
+        pass
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+def current_span():
+    """The innermost active span, or a stand-in that ignores attributes."""
+    return _current_span.get() or _NoSpan()
+
+@contextmanager
+def span(name, **attributes):
+    current = Span(name, _current_span.get(), **attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.finish(e)
+        raise
+    else:
+        current.finish()
+    finally:
+        _current_span.reset(token)
+
+async def wait_for(awaitable, timeout):
+    """asyncio.wait_for that records the spans it cancels on timeout with status timeout."""
+    if timeout is None:
+        return await awaitable
+    deadline = {"expired": False}
+    token = _deadline.set(deadline)
+    try:
+        # The task copies the current context, including the deadline
+        task = asyncio.ensure_future(awaitable)
+    finally:
+        _deadline.reset(token)
+
+    def expire():
+        deadline["expired"] = True
+        task.cancel()
+
+    handle = asyncio.get_running_loop().call_later(timeout, expire)
+    try:
+        return await task
+    except asyncio.CancelledError:
+        if deadline["expired"]:
+            raise asyncio.TimeoutError() from None
+        raise
+    finally:
+        handle.cancel()
+
+def traced(name=None):
+    """Decorator running a function (sync or async) inside a span named after it."""
+    def decorator(func):
+        span_name = name or func.__name__
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return None
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+_server = None
+_server_lock = threading.Lock()
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    """Serve /metrics from a daemon thread; safe to call on every Streamlit rerun."""
+    global _server
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                # Another process (e.g. a second app instance) already serves this port
+                logging.warning(f"Metrics endpoint not started on {host}:{port}: {str(e)}")
+                _server = False
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+            logging.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return _server or None
@@ -0,0 +1,74 @@
+import os
+import shutil
+import logging
+from disk_cache import CACHE_DIR, DiskCache, file_sha256, make_key
+from metrics import cache_requests
+
+RENDER_CACHE_DIR = os.environ.get("RENDER_CACHE_DIR", os.path.join(CACHE_DIR, "renders"))
+RENDER_CACHE_MAX_BYTES = int(os.environ.get("RENDER_CACHE_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+
+OUTPUT_NAME = "output.mp4"
+
+_cache = None
+
+def get_render_cache():
+    global _cache
+    if _cache is None:
+        _cache = DiskCache(RENDER_CACHE_DIR, RENDER_CACHE_MAX_BYTES)
+    return _cache
+
+def normalize_style(font_color, bg_color, font_size, transparency):
+    return {
+        "font_color": font_color.lstrip('#').lower(),
+        "bg_color": bg_color.lstrip('#').lower(),
+        "font_size": int(font_size),
+        "transparency": int(transparency),
+    }
+
+def render_cache_key(media_hash, subtitle_file, style, mode, **options):
+    # Full and incremental renders with the same encoder arguments produce the same
+    # picture, so callers pass one mode for both and the encoder arguments as an option
+    return make_key("render", media_hash, file_sha256(subtitle_file), style, mode, options)
+
+def snapshot_subtitles(subtitle_file, output_dir):
+    """Copy subtitle_file to a path named after its content, for a render job to read.
+
+    Saved edits rewrite subtitle_file while a job may still be queued; the
+    snapshot never changes, so the output matches the key it is cached under.
+    """
+    base, ext = os.path.splitext(os.path.basename(subtitle_file))
+    snapshot_path = os.path.join(output_dir, f"{base}-{file_sha256(subtitle_file)[:16]}{ext}")
+    if not os.path.exists(snapshot_path):
+        shutil.copyfile(subtitle_file, snapshot_path + ".tmp")
+        os.replace(snapshot_path + ".tmp", snapshot_path)
+    return snapshot_path
+
+def _link_or_copy(src, dst):
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+def load_render(key, output_path):
+    cache = get_render_cache()
+    entry_dir = cache.get(key)
+    if entry_dir is None:
+        cache_requests.inc(cache="render", result="miss")
+        return False
+    try:
+        _link_or_copy(os.path.join(entry_dir, OUTPUT_NAME), output_path)
+    except OSError as e:
+        logging.warning(f"Unreadable render cache entry {key}: {str(e)}")
+        cache_requests.inc(cache="render", result="miss")
+        return False
+    cache_requests.inc(cache="render", result="hit")
+    logging.info(f"Render cache hit ({cache.hits} hits / {cache.misses} misses)")
+    return True
+
+def store_render(key, output_path):
+    cache = get_render_cache()
+    staging_dir = cache.staging_dir()
+    _link_or_copy(output_path, os.path.join(staging_dir, OUTPUT_NAME))
+    cache.commit(key, staging_dir)
@@ -0,0 +1,290 @@
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import cpu_count
+from disk_cache import CACHE_DIR
+from video_processor import add_subtitles_to_video, mux_subtitles, render_preview
+from incremental_render import render_incremental
+from render_cache import store_render
+from metrics import queue_wait, span, start_metrics_server
+
+RENDER_QUEUE_DB = os.environ.get("RENDER_QUEUE_DB", os.path.join(CACHE_DIR, "render_queue.db"))
+# Cores shared by every render on this machine, across sessions and processes
+RENDER_TOTAL_CORES = int(os.environ.get("RENDER_TOTAL_CORES", cpu_count()))
+RENDER_JOB_CORES = int(os.environ.get("RENDER_JOB_CORES", max(1, RENDER_TOTAL_CORES // 2)))
+RENDER_JOB_TIMEOUT = float(os.environ.get("RENDER_JOB_TIMEOUT", 600))
+# Run the worker pool inside the app process; set to 0 when running `python render_queue.py` separately
+RENDER_WORKER_EMBEDDED = os.environ.get("RENDER_WORKER_EMBEDDED", "1") == "1"
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Minimum seconds between progress writes to the database per job
+PROGRESS_UPDATE_INTERVAL = 1.0
+
+# Job kind -> callable(**params, threads=..., timeout=..., on_progress=...)
+JOB_HANDLERS = {
+    "burn": add_subtitles_to_video,
+    "incremental": render_incremental,
+    "preview": render_preview,
+    "soft": mux_subtitles,
+}
+
+def _connect(db_path=None):
+    db_path = db_path or RENDER_QUEUE_DB
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            params TEXT NOT NULL,
+            cores INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            created REAL NOT NULL,
+            started REAL,
+            finished REAL,
+            worker_pid INTEGER,
+            error TEXT,
+            progress TEXT,
+            cache_key TEXT
+        )"""
+    )
+    # Columns added after the first release
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+    for column in ("progress", "cache_key"):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+    return conn
+
+def _row_to_job(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    job["progress"] = json.loads(job["progress"]) if job.get("progress") else None
+    return job
+
+def job_cores(cores=None):
+    return min(cores or RENDER_JOB_CORES, RENDER_TOTAL_CORES)
+
+def submit_job(kind, params, cores=None, cache_key=None, db_path=None):
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown render job kind: {kind}")
+    cores = job_cores(cores)
+    job_id = uuid.uuid4().hex
+    conn = _connect(db_path)
+    try:
+        conn.execute(
+            "INSERT INTO jobs (id, kind, params, cores, status, created, cache_key) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, json.dumps(params), cores, QUEUED, time.time(), cache_key),
+        )
+    finally:
+        conn.close()
+    logging.info(f"Queued {kind} render job {job_id} ({cores} cores)")
+    return job_id
+
+def get_job(job_id, db_path=None):
+    conn = _connect(db_path)
+    try:
+        return _row_to_job(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+    finally:
+        conn.close()
+
+def queue_status(db_path=None):
+    conn = _connect(db_path)
+    try:
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        busy = conn.execute("SELECT COALESCE(SUM(cores), 0) FROM jobs WHERE status = ?", (RUNNING,)).fetchone()[0]
+    finally:
+        conn.close()
+    return {"jobs": counts, "busy_cores": busy, "total_cores": RENDER_TOTAL_CORES}
+
+def active_job_paths(db_path=None):
+    """Files read and written by queued or running jobs."""
+    conn = _connect(db_path)
+    try:
+        rows = conn.execute("SELECT kind, params FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)).fetchall()
+    finally:
+        conn.close()
+    paths = []
+    for row in rows:
+        params = json.loads(row["params"])
+        paths += [params.get("video_path"), params.get("subtitle_file")]
+        if params.get("output_path"):
+            # Renders also write a partial file, an ASS file (soft) or segments (incremental) next to the output
+            base, ext = os.path.splitext(params["output_path"])
+            paths += [params["output_path"], f"{base}.part{ext}", f"{base}.ass"]
+            if row["kind"] == "incremental":
+                paths.append(os.path.join(os.path.dirname(params["output_path"]), "segments"))
+    return paths
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class RenderWorkerPool:
+    """Runs queued render jobs while keeping the cores of all running jobs under a budget.
+
+    Admission is decided against the shared database, so several pools (one per
+    app process or a standalone worker) never oversubscribe the machine together.
+    """
+
+    def __init__(self, total_cores=RENDER_TOTAL_CORES, db_path=None, poll_interval=0.5):
+        self.total_cores = total_cores
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self._executor = ThreadPoolExecutor(max_workers=total_cores, thread_name_prefix="render")
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._requeue_orphans()
+        self._thread = threading.Thread(target=self._dispatch_loop, name="render-dispatcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def _requeue_orphans(self):
+        # Jobs left running by a worker process that died are put back in the queue
+        conn = _connect(self.db_path)
+        try:
+            rows = conn.execute("SELECT id, worker_pid FROM jobs WHERE status = ?", (RUNNING,)).fetchall()
+            for row in rows:
+                if row["worker_pid"] is None or not _pid_alive(row["worker_pid"]):
+                    conn.execute("UPDATE jobs SET status = ?, started = NULL, worker_pid = NULL WHERE id = ?", (QUEUED, row["id"]))
+                    logging.warning(f"Requeued orphaned render job {row['id']}")
+        finally:
+            conn.close()
+
+    def _claim_next(self, conn):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            busy = conn.execute("SELECT COALESCE(SUM(cores), 0) FROM jobs WHERE status = ?", (RUNNING,)).fetchone()[0]
+            free = self.total_cores - busy
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created LIMIT 1", (QUEUED,)
+            ).fetchone()
+            # Strict FIFO: the oldest job waits for enough free cores instead of being overtaken
+            if row is None or (row["cores"] > free and busy > 0):
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, started = ?, worker_pid = ? WHERE id = ?",
+                (RUNNING, time.time(), os.getpid(), row["id"]),
+            )
+            conn.execute("COMMIT")
+            return _row_to_job(row)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _dispatch_loop(self):
+        conn = _connect(self.db_path)
+        try:
+            while not self._stop.is_set():
+                try:
+                    job = self._claim_next(conn)
+                except sqlite3.Error as e:
+                    logging.error(f"Render queue error: {str(e)}")
+                    job = None
+                if job is None:
+                    self._stop.wait(self.poll_interval)
+                    continue
+                self._executor.submit(self._run_job, job)
+        finally:
+            conn.close()
+
+    def _finish(self, job_id, status, error=None):
+        conn = _connect(self.db_path)
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished = ?, error = ? WHERE id = ?",
+                (status, time.time(), error, job_id),
+            )
+        finally:
+            conn.close()
+
+    def _progress_writer(self, job_id):
+        last_write = 0.0
+
+        def on_progress(progress):
+            nonlocal last_write
+            now = time.time()
+            if now - last_write < PROGRESS_UPDATE_INTERVAL and not progress["done"]:
+                return
+            last_write = now
+            conn = _connect(self.db_path)
+            try:
+                conn.execute("UPDATE jobs SET progress = ? WHERE id = ?", (json.dumps(progress), job_id))
+            except sqlite3.Error as e:
+                logging.warning(f"Could not store progress of render job {job_id}: {str(e)}")
+            finally:
+                conn.close()
+
+        return on_progress
+
+    def _run_job(self, job):
+        handler = JOB_HANDLERS[job["kind"]]
+        start_time = time.time()
+        queue_wait.observe(start_time - job["created"], queue="render", kind=job["kind"])
+        try:
+            with span("render_job", kind=job["kind"], job_id=job["id"], cores=job["cores"]):
+                handler(**job["params"], threads=job["cores"], timeout=RENDER_JOB_TIMEOUT,
+                        on_progress=self._progress_writer(job["id"]))
+        except Exception as e:
+            logging.error(f"Render job {job['id']} failed: {str(e)}")
+            self._finish(job["id"], FAILED, str(e))
+            return
+        logging.info(f"Render job {job['id']} finished in {time.time() - start_time:.2f} seconds")
+        if job["cache_key"]:
+            try:
+                store_render(job["cache_key"], job["params"]["output_path"])
+            except OSError as e:
+                logging.warning(f"Could not cache output of render job {job['id']}: {str(e)}")
+        self._finish(job["id"], DONE)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def ensure_worker_pool():
+    global _pool
+    if not RENDER_WORKER_EMBEDDED:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = RenderWorkerPool().start()
+    return _pool
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    start_metrics_server()
+    pool = RenderWorkerPool().start()
+    logging.info(f"Render worker pool started with {pool.total_cores} cores, queue {RENDER_QUEUE_DB}")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pool.stop()
+        sys.exit(0)
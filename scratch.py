@@ -0,0 +1,253 @@
+import os
+import time
+import uuid
+import shutil
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+SCRATCH_ROOT = os.environ.get("SCRATCH_ROOT", os.path.join(tempfile.gettempdir(), "videotranscriber-scratch"))
+SCRATCH_QUOTA_BYTES = int(os.environ.get("SCRATCH_QUOTA_BYTES", 2 * 1024 * 1024 * 1024))
+# Sessions without activity for this long are removed
+SCRATCH_SESSION_TTL = float(os.environ.get("SCRATCH_SESSION_TTL", 3600))
+SCRATCH_SWEEP_INTERVAL = float(os.environ.get("SCRATCH_SWEEP_INTERVAL", 60))
+
+# Artifact kinds that can be recreated from the session's input and subtitles,
+# evicted before whole sessions are
+REGENERABLE_KINDS = ("output", "preview", "segments", "audio")
+
+def _path_size(path):
+    if os.path.isdir(path):
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+def _overlaps(a, b):
+    return a == b or a.startswith(b + os.sep) or b.startswith(a + os.sep)
+
+class ScratchSpace:
+    """Per-session scratch directories under a global byte quota.
+
+    Every session gets a directory and registers the artifacts it creates.
+    enforce() removes sessions idle for longer than the TTL, then evicts
+    regenerable artifacts and finally whole sessions, least recently used
+    first, until usage is under the quota. Paths pinned with in_use() or
+    reported by a protector (e.g. inputs of running render jobs) are kept.
+    """
+
+    def __init__(self, root=SCRATCH_ROOT, quota_bytes=SCRATCH_QUOTA_BYTES, session_ttl=SCRATCH_SESSION_TTL):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.session_ttl = session_ttl
+        self._sessions = {}
+        self._artifacts = {}
+        self._pins = {}
+        self._protectors = []
+        self._lock = threading.RLock()
+        os.makedirs(self.root, exist_ok=True)
+        self._adopt_existing()
+
+    def _adopt_existing(self):
+        # Directories left by a previous process are tracked so the TTL cleans them up
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if os.path.isdir(path):
+                self._sessions[name] = {"dir": path, "last_access": os.path.getmtime(path)}
+
+    def session_dir(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = {"dir": os.path.join(self.root, session_id), "last_access": time.time()}
+                self._sessions[session_id] = session
+            os.makedirs(session["dir"], exist_ok=True)
+            session["last_access"] = time.time()
+            return session["dir"]
+
+    def touch(self, session_id):
+        with self._lock:
+            if session_id in self._sessions:
+                self._sessions[session_id]["last_access"] = time.time()
+
+    def register(self, session_id, path, kind):
+        with self._lock:
+            self._artifacts[os.path.abspath(path)] = {"session": session_id, "kind": kind, "last_access": time.time()}
+            self.touch(session_id)
+        return path
+
+    def upload_dir(self, session_id):
+        """A new directory in the session for one upload and the files derived from it.
+
+        Render jobs of an earlier upload may still read its files, so a new
+        upload never writes to the same paths.
+        """
+        path = os.path.join(self.session_dir(session_id), f"upload-{uuid.uuid4().hex[:12]}")
+        os.makedirs(path)
+        return path
+
+    def clear_session(self, session_id):
+        """Remove the session's files but keep its directory."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return
+            for path in [path for path, artifact in self._artifacts.items() if artifact["session"] == session_id]:
+                del self._artifacts[path]
+            protected = self._protected_paths()
+            if protected is None:
+                return
+            for name in os.listdir(session["dir"]):
+                self._clear(os.path.join(session["dir"], name), protected)
+
+    def _clear(self, path, protected):
+        if not self._is_protected(path, protected):
+            _remove(path)
+        elif os.path.isdir(path) and os.path.abspath(path) not in protected:
+            # Only a file inside is in use, e.g. by a render job of an earlier upload
+            for name in os.listdir(path):
+                self._clear(os.path.join(path, name), protected)
+
+    def add_protector(self, protector):
+        """Register a callable returning paths that must not be removed."""
+        with self._lock:
+            if protector not in self._protectors:
+                self._protectors.append(protector)
+
+    @contextmanager
+    def in_use(self, *paths):
+        paths = [os.path.abspath(path) for path in paths]
+        with self._lock:
+            for path in paths:
+                self._pins[path] = self._pins.get(path, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                for path in paths:
+                    self._pins[path] -= 1
+                    if not self._pins[path]:
+                        del self._pins[path]
+
+    def _protected_paths(self):
+        paths = set(self._pins)
+        for protector in self._protectors:
+            try:
+                paths.update(os.path.abspath(path) for path in protector() if path)
+            except Exception as e:
+                logging.warning(f"Scratch protector failed, skipping eviction: {str(e)}")
+                # Without knowing what is in use, nothing is safe to remove
+                return None
+        return paths
+
+    def _is_protected(self, path, protected=None):
+        if protected is None:
+            protected = self._protected_paths()
+        if protected is None:
+            return True
+        path = os.path.abspath(path)
+        return any(_overlaps(path, other) for other in protected)
+
+    def _remove_session(self, session_id):
+        session = self._sessions.pop(session_id)
+        for path in [path for path, artifact in self._artifacts.items() if artifact["session"] == session_id]:
+            del self._artifacts[path]
+        _remove(session["dir"])
+
+    def usage(self):
+        with self._lock:
+            sizes = {session_id: _path_size(session["dir"]) for session_id, session in self._sessions.items()}
+            return {
+                "bytes": sum(sizes.values()),
+                "quota_bytes": self.quota_bytes,
+                "sessions": len(self._sessions),
+                "artifacts": len(self._artifacts),
+                "pinned": len(self._pins),
+                "largest_sessions": sorted(sizes.items(), key=lambda item: item[1], reverse=True)[:5],
+            }
+
+    def enforce(self):
+        with self._lock:
+            protected = self._protected_paths()
+            if protected is None:
+                return
+            now = time.time()
+
+            for session_id, session in list(self._sessions.items()):
+                if now - session["last_access"] > self.session_ttl and not self._is_protected(session["dir"], protected):
+                    logging.info(f"Removing idle scratch session {session_id}")
+                    self._remove_session(session_id)
+
+            sizes = {session_id: _path_size(session["dir"]) for session_id, session in self._sessions.items()}
+            total = sum(sizes.values())
+            if total <= self.quota_bytes:
+                return
+
+            # Regenerable artifacts of the least recently active sessions go first
+            candidates = sorted(
+                (
+                    (self._sessions[artifact["session"]]["last_access"], artifact["last_access"], path)
+                    for path, artifact in self._artifacts.items()
+                    if artifact["kind"] in REGENERABLE_KINDS and artifact["session"] in self._sessions
+                ),
+            )
+            for _, _, path in candidates:
+                if total <= self.quota_bytes:
+                    return
+                if self._is_protected(path, protected) or not os.path.exists(path):
+                    continue
+                size = _path_size(path)
+                _remove(path)
+                del self._artifacts[path]
+                total -= size
+                logging.info(f"Evicted scratch artifact {path} ({size} bytes)")
+
+            for session_id in sorted(self._sessions, key=lambda session_id: self._sessions[session_id]["last_access"]):
+                if total <= self.quota_bytes:
+                    return
+                if self._is_protected(self._sessions[session_id]["dir"], protected):
+                    continue
+                size = _path_size(self._sessions[session_id]["dir"])
+                logging.info(f"Evicting scratch session {session_id} ({size} bytes) to stay under quota")
+                self._remove_session(session_id)
+                total -= size
+
+            if total > self.quota_bytes:
+                logging.warning(f"Scratch usage {total} bytes exceeds quota {self.quota_bytes}, remaining files are in use")
+
+    def start_sweeper(self, interval=SCRATCH_SWEEP_INTERVAL):
+        def sweep():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.enforce()
+                except Exception as e:
+                    logging.error(f"Scratch sweep failed: {str(e)}")
+
+        threading.Thread(target=sweep, name="scratch-sweeper", daemon=True).start()
+        return self
+
+_scratch = None
+_scratch_lock = threading.Lock()
+
+def get_scratch_space():
+    global _scratch
+    with _scratch_lock:
+        if _scratch is None:
+            _scratch = ScratchSpace().start_sweeper()
+    return _scratch
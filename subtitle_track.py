@@ -0,0 +1,230 @@
+import re
+import difflib
+from array import array
+from itertools import accumulate
+from bisect import bisect_left, bisect_right
+
+class Cue:
+    __slots__ = ("start", "end", "text")
+
+    def __init__(self, start, end, text):
+        self.start = start
+        self.end = end
+        self.text = text
+
+    def __eq__(self, other):
+        return isinstance(other, Cue) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return f"Cue({self.start:.3f}, {self.end:.3f}, {self.text!r})"
+
+    def key(self):
+        # Millisecond resolution, the precision of every format we write
+        return (round(self.start * 1000), round(self.end * 1000), self.text)
+
+def format_timestamp(seconds, separator=","):
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3_600_000)
+    minutes, millis = divmod(millis, 60_000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millis:03d}"
+
+def format_ass_timestamp(seconds):
+    centis = int(round(seconds * 100))
+    hours, centis = divmod(centis, 360_000)
+    minutes, centis = divmod(centis, 6000)
+    secs, centis = divmod(centis, 100)
+    return f"{hours:d}:{minutes:02d}:{secs:02d}.{centis:02d}"
+
+def parse_timestamp(time_str):
+    parts = time_str.strip().replace(',', '.').split(':')
+    seconds = float(parts[-1])
+    if len(parts) > 1:
+        seconds += int(parts[-2]) * 60
+    if len(parts) > 2:
+        seconds += int(parts[-3]) * 3600
+    return seconds
+
+ASS_OVERRIDE_RE = re.compile(r"\{[^}]*\}")
+
+class SubtitleTrack:
+    """Subtitle cues stored as parallel arrays sorted by start time.
+
+    Start and end times live in compact float arrays, so finding the cue active
+    at a time or the cues in a range is a binary search instead of a scan.
+    max_ends holds the latest end of each cue and every cue before it, which
+    bounds how far back a long cue can still be running.
+    """
+
+    __slots__ = ("starts", "ends", "max_ends", "texts")
+
+    def __init__(self, cues=()):
+        cues = sorted(cues, key=lambda cue: (cue.start, cue.end))
+        self.starts = array('d', (cue.start for cue in cues))
+        self.ends = array('d', (cue.end for cue in cues))
+        self.max_ends = array('d', accumulate(self.ends, max))
+        self.texts = [cue.text for cue in cues]
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __iter__(self):
+        for i in range(len(self.texts)):
+            yield self[i]
+
+    def __getitem__(self, i):
+        return Cue(self.starts[i], self.ends[i], self.texts[i])
+
+    def __eq__(self, other):
+        return isinstance(other, SubtitleTrack) and list(self) == list(other)
+
+    def cue_at(self, t):
+        """Index of the latest-starting cue that is active at time t, or None."""
+        # Cues before lo all end by t
+        lo = bisect_right(self.max_ends, t)
+        for i in range(bisect_right(self.starts, t) - 1, lo - 1, -1):
+            if self.ends[i] > t:
+                return i
+        return None
+
+    def cues_between(self, start, end):
+        """Cues overlapping [start, end), as Cue objects in start order."""
+        # Cues are sorted by start only; an earlier, longer cue can still be
+        # running at `start`, but none before the first max end past it.
+        hi = bisect_left(self.starts, end)
+        lo = bisect_right(self.max_ends, start)
+        return [self[i] for i in range(lo, hi) if self.ends[i] > start]
+
+    def diff(self, other):
+        """Time ranges that differ between this track and other.
+
+        Returns a list of (start, end) spans covering every cue that was
+        added, removed or changed, in source time.
+        """
+        matcher = difflib.SequenceMatcher(None, [cue.key() for cue in self], [cue.key() for cue in other], autojunk=False)
+        spans = []
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                continue
+            times = [(self.starts[i], self.ends[i]) for i in range(i1, i2)]
+            times += [(other.starts[j], other.ends[j]) for j in range(j1, j2)]
+            spans.append((min(t[0] for t in times), max(t[1] for t in times)))
+        return spans
+
+    @classmethod
+    def from_transcription(cls, transcription):
+        paragraphs = transcription["results"]["channels"][0]["alternatives"][0]["paragraphs"]["paragraphs"]
+        return cls(
+            Cue(sentence["start"], sentence["end"], sentence["text"])
+            for paragraph in paragraphs
+            for sentence in paragraph["sentences"]
+        )
+
+    @classmethod
+    def from_srt(cls, content):
+        """Parse SRT text, raising ValueError for any block without a valid timecode line.
+
+        Skipping such a block would silently drop a cue when edited text is saved.
+        """
+        cues = []
+        blocks = [block.strip() for block in content.strip().replace('\r\n', '\n').split('\n\n')]
+        for number, block in enumerate((block for block in blocks if block), 1):
+            lines = block.split('\n')
+            # The index line is optional, the timecode line is what identifies a cue
+            for i, line in enumerate(lines[:2]):
+                if ' --> ' in line:
+                    try:
+                        start, end = line.split(' --> ')
+                        cues.append(Cue(parse_timestamp(start), parse_timestamp(end.split()[0]), '\n'.join(lines[i + 1:])))
+                    except (ValueError, IndexError):
+                        raise ValueError(f"Subtitle block {number} has an invalid timecode line: {line!r}")
+                    break
+            else:
+                raise ValueError(f"Subtitle block {number} has no timecode line: {lines[0]!r}")
+        return cls(cues)
+
+    @classmethod
+    def from_vtt(cls, content):
+        blocks = content.strip().replace('\r\n', '\n').split('\n\n')
+        if blocks and blocks[0].startswith("WEBVTT"):
+            blocks = blocks[1:]
+        return cls.from_srt('\n\n'.join(block for block in blocks if not block.startswith(("NOTE", "STYLE", "REGION"))))
+
+    @classmethod
+    def from_ass(cls, content):
+        cues = []
+        fields = None
+        in_events = False
+        for line in content.replace('\r\n', '\n').split('\n'):
+            line = line.strip()
+            if line.startswith('['):
+                in_events = line.lower() == "[events]"
+                continue
+            if not in_events:
+                continue
+            if line.startswith("Format:"):
+                fields = [field.strip().lower() for field in line[len("Format:"):].split(',')]
+            elif line.startswith("Dialogue:") and fields:
+                values = line[len("Dialogue:"):].split(',', len(fields) - 1)
+                event = dict(zip(fields, (value.strip() for value in values)))
+                text = ASS_OVERRIDE_RE.sub('', event["text"]).replace('\\N', '\n').replace('\\n', '\n')
+                cues.append(Cue(parse_timestamp(event["start"]), parse_timestamp(event["end"]), text))
+        return cls(cues)
+
+    @classmethod
+    def parse(cls, content, fmt="srt"):
+        return {"srt": cls.from_srt, "vtt": cls.from_vtt, "ass": cls.from_ass}[fmt](content)
+
+    @classmethod
+    def load(cls, path):
+        ext = path.rsplit('.', 1)[-1].lower()
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.parse(f.read(), {"vtt": "vtt", "ass": "ass", "ssa": "ass"}.get(ext, "srt"))
+
+    def shifted(self, offset):
+        return SubtitleTrack(Cue(max(0.0, cue.start + offset), cue.end + offset, cue.text) for cue in self)
+
+    def to_srt(self):
+        return ''.join(
+            f"{i}\n{format_timestamp(cue.start)} --> {format_timestamp(cue.end)}\n{cue.text}\n\n"
+            for i, cue in enumerate(self, 1)
+        )
+
+    def to_vtt(self):
+        return "WEBVTT\n\n" + ''.join(
+            f"{format_timestamp(cue.start, '.')} --> {format_timestamp(cue.end, '.')}\n{cue.text}\n\n"
+            for cue in self
+        )
+
+    def to_ass(self, font_name="LiberationSans-Regular", font_size=10, primary_colour="&H00FFFFFF", back_colour="&H80000000"):
+        header = (
+            "[Script Info]\n"
+            "ScriptType: v4.00+\n"
+            "PlayResX: 384\n"
+            "PlayResY: 288\n"
+            "WrapStyle: 0\n\n"
+            "[V4+ Styles]\n"
+            "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, "
+            "Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, "
+            "MarginL, MarginR, MarginV, Encoding\n"
+            f"Style: Default,{font_name},{font_size},{primary_colour},&H000000FF,{back_colour},{back_colour},"
+            "0,0,0,0,100,100,0,0,1,1,0,2,10,10,10,1\n\n"
+            "[Events]\n"
+            "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+        )
+        events = []
+        for cue in self:
+            text = cue.text.replace('\n', '\\N')
+            events.append(f"Dialogue: 0,{format_ass_timestamp(cue.start)},{format_ass_timestamp(cue.end)},Default,,0,0,0,,{text}\n")
+        return header + ''.join(events)
+
+    def serialize(self, fmt="srt"):
+        return {"srt": self.to_srt, "vtt": self.to_vtt, "ass": self.to_ass}[fmt]()
+
+    def save(self, path, fmt="srt"):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.serialize(fmt))
+        return path
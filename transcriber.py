@@ -1,43 +1,187 @@
 import os
+import copy
 import asyncio
+import logging
+import tempfile
+import functools
 import aiofiles
-import httpx
 from datetime import datetime
-from deepgram import (
-    DeepgramClient,
-    PrerecordedOptions,
+from video_processor import (
+    AUDIO_PROFILES,
+    TRANSCRIPTION_AUDIO_PROFILE,
+    audio_path_for_profile,
+    detect_silences,
+    extract_audio,
+    plan_chunks,
+    probe_duration,
+    split_audio,
+    stream_audio,
 )
+from vad import remap_transcription, trim_to_speech
+from metrics import current_span, file_size, traced
+from transcription_client import get_transcription_client
 
-DEEPGRAM_API_KEY = os.environ.get("DG_API_KEY")
+UPLOAD_CHUNK_SIZE = int(os.environ.get("TRANSCRIPTION_UPLOAD_CHUNK_SIZE", 256 * 1024))
 
-async def transcribe_audio(audio_file, language="fi",model="whisper-large"):
-    try:
-        if not DEEPGRAM_API_KEY:
-            raise ValueError("Deepgram API key is not set. Please set the DG_API_KEY environment variable.")
+# Stream ffmpeg output straight into the request body instead of extracting to a file first
+PIPELINED_TRANSCRIPTION = os.environ.get("PIPELINED_TRANSCRIPTION", "1") == "1"
+
+# Long-media mode
+LONG_MEDIA_THRESHOLD = float(os.environ.get("LONG_MEDIA_THRESHOLD", 600))
+CHUNK_MAX_SECONDS = float(os.environ.get("TRANSCRIPTION_CHUNK_SECONDS", 300))
+CHUNK_CONCURRENCY = int(os.environ.get("TRANSCRIPTION_CONCURRENCY", 4))
+# Total time allowed for cutting long media into chunks
+CHUNK_SPLIT_TIMEOUT = float(os.environ.get("TRANSCRIPTION_SPLIT_TIMEOUT", 600))
 
-        deepgram = DeepgramClient(DEEPGRAM_API_KEY)
-        
-        async with aiofiles.open(audio_file, "rb") as file:
-            buffer_data = await file.read()
+async def read_audio_chunks(audio_file, chunk_size=UPLOAD_CHUNK_SIZE):
+    async with aiofiles.open(audio_file, "rb") as file:
+        while True:
+            chunk = await file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
 
-        payload = {
-            "buffer": buffer_data,
-        }
+async def _transcribe_payload(body, language, model):
+    # The shared client pools connections and retries transient failures
+    options = {
+        "model": model,
+        "smart_format": "true",
+        "language": language,
+        "punctuate": "true",
+        "paragraphs": "true",
+    }
 
-        options = PrerecordedOptions(
-            model=model,
-            smart_format=True,
-            language=language,
-            punctuate=True,
-            paragraphs=True
-        )
+    response = await get_transcription_client().transcribe(body, options)
+    duration = response["metadata"]["duration"]
 
-        response = await deepgram.listen.asyncrest.v("1").transcribe_file(
-            payload, options, timeout=httpx.Timeout(300.0, connect=10.0)
-        )
-        duration = response["metadata"]["duration"]
+    return response,duration
+
+@traced()
+async def transcribe_audio(audio_file, language="fi",model="whisper-large"):
+    current_span().set(language=language, model=model, bytes_in=file_size(audio_file))
+    try:
+        # Stream the file from disk instead of holding the whole payload in memory,
+        # reopening it if the request is retried
+        return await _transcribe_payload(functools.partial(read_audio_chunks, audio_file), language, model)
 
-        return response.to_dict(),duration
+    except Exception as e:
+        raise Exception(f"Error transcribing audio with Deepgram: {str(e)}")
 
+@traced()
+async def transcribe_video_stream(video_path, language="fi", model="whisper-large", audio_profile=None,
+                                  duration=None, on_progress=None):
+    current_span().set(language=language, model=model, profile=audio_profile)
+    try:
+        # A retry restarts ffmpeg; the client closes each stream, killing ffmpeg if the
+        # request failed, timed out or was cancelled mid-stream. on_progress is called
+        # on the transcription client's thread.
+        body = functools.partial(stream_audio, video_path, audio_profile, duration=duration, on_progress=on_progress)
+        return await _transcribe_payload(body, language, model)
     except Exception as e:
         raise Exception(f"Error transcribing audio with Deepgram: {str(e)}")
+
+def _shift(item, offset):
+    item["start"] = item["start"] + offset
+    item["end"] = item["end"] + offset
+    return item
+
+def merge_transcriptions(results):
+    """Merge (response, offset, duration) chunk results into one Deepgram-shaped response."""
+    merged = copy.deepcopy(results[0][0])
+    alternative = merged["results"]["channels"][0]["alternatives"][0]
+
+    transcripts = []
+    paragraph_transcripts = []
+    words = []
+    paragraphs = []
+    confidences = []
+    for response, offset, _ in results:
+        chunk_alternative = response["results"]["channels"][0]["alternatives"][0]
+        if chunk_alternative.get("transcript"):
+            transcripts.append(chunk_alternative["transcript"])
+        confidences.append(chunk_alternative.get("confidence", 0.0))
+        words.extend(_shift(dict(word), offset) for word in chunk_alternative.get("words", []))
+
+        chunk_paragraphs = chunk_alternative.get("paragraphs") or {}
+        if chunk_paragraphs.get("transcript"):
+            paragraph_transcripts.append(chunk_paragraphs["transcript"].strip())
+        for paragraph in chunk_paragraphs.get("paragraphs", []):
+            paragraph = _shift(dict(paragraph), offset)
+            paragraph["sentences"] = [_shift(dict(sentence), offset) for sentence in paragraph["sentences"]]
+            paragraphs.append(paragraph)
+
+    alternative["transcript"] = " ".join(transcripts)
+    alternative["confidence"] = sum(confidences) / len(confidences)
+    alternative["words"] = words
+    alternative["paragraphs"] = {
+        "transcript": "\n\n".join(paragraph_transcripts),
+        "paragraphs": paragraphs,
+    }
+
+    _, last_offset, last_duration = results[-1]
+    merged["metadata"]["duration"] = last_offset + last_duration
+    return merged
+
+async def transcribe_chunk(chunk_path, offset, language, model, semaphore):
+    # Transient failures are retried by the transcription client
+    async with semaphore:
+        try:
+            response, duration = await transcribe_audio(chunk_path, language, model)
+        except Exception as e:
+            raise Exception(f"Chunk at {offset:.1f}s failed: {str(e)}")
+        return response, offset, duration
+
+@traced()
+async def transcribe_long_audio(audio_file, language="fi", model="whisper-large", audio_profile=None,
+                                max_chunk=CHUNK_MAX_SECONDS, concurrency=CHUNK_CONCURRENCY):
+    duration = await asyncio.to_thread(probe_duration, audio_file)
+    silences = await asyncio.to_thread(detect_silences, audio_file)
+    chunks = plan_chunks(duration, silences, max_chunk)
+    current_span().set(language=language, model=model, chunks=len(chunks), bytes_in=file_size(audio_file))
+    logging.info(f"Transcribing {duration:.1f}s of audio as {len(chunks)} chunks, {concurrency} at a time")
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(audio_file))) as chunk_dir:
+        chunk_paths = await asyncio.to_thread(split_audio, audio_file, chunks, chunk_dir, audio_profile, CHUNK_SPLIT_TIMEOUT)
+        semaphore = asyncio.Semaphore(concurrency)
+        results = await asyncio.gather(*(
+            transcribe_chunk(path, start, language, model, semaphore)
+            for path, (start, _) in zip(chunk_paths, chunks)
+        ))
+
+    merged = merge_transcriptions(results)
+    return merged, merged["metadata"]["duration"]
+
+@traced()
+async def transcribe_speech_only(video_path, work_dir, language="fi", model="whisper-large", audio_profile=None, media_duration=None):
+    """Transcribe only the speech regions of a video and return source-time results.
+
+    A 16 kHz WAV is extracted for voice activity detection, the speech is
+    concatenated and encoded with the transcription profile, and the
+    response timestamps are mapped back through the VAD offset map.
+    """
+    profile = audio_profile or TRANSCRIPTION_AUDIO_PROFILE
+    if profile == "copy":
+        # The trimmed audio is re-encoded anyway
+        profile = "opus"
+    wav_path = audio_path_for_profile(work_dir, "wav", "vad_source")
+    speech_path = audio_path_for_profile(work_dir, profile, "speech")
+    encode_args = None
+    if profile != "wav":
+        encode_args = AUDIO_PROFILES[profile]["args"]
+    try:
+        await asyncio.to_thread(extract_audio, video_path, wav_path, "wav", None, media_duration)
+        offset_map = await asyncio.to_thread(trim_to_speech, wav_path, speech_path, encode_args, AUDIO_PROFILES[profile]["format"])
+        current_span().set(language=language, model=model, source_seconds=offset_map.source_duration,
+                           speech_seconds=offset_map.trimmed_duration)
+
+        if offset_map.trimmed_duration > LONG_MEDIA_THRESHOLD:
+            transcription, _ = await transcribe_long_audio(speech_path, language, model, profile)
+        else:
+            transcription, _ = await transcribe_audio(speech_path, language, model)
+    finally:
+        for path in (wav_path, speech_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    transcription = remap_transcription(transcription, offset_map)
+    return transcription, transcription["metadata"]["duration"]
@@ -0,0 +1,49 @@
+import os
+import json
+import logging
+from disk_cache import CACHE_DIR, DiskCache, make_key
+from metrics import cache_requests
+
+TRANSCRIPTION_CACHE_DIR = os.environ.get("TRANSCRIPTION_CACHE_DIR", os.path.join(CACHE_DIR, "transcriptions"))
+TRANSCRIPTION_CACHE_MAX_BYTES = int(os.environ.get("TRANSCRIPTION_CACHE_MAX_BYTES", 200 * 1024 * 1024))
+
+_cache = None
+
+def get_transcription_cache():
+    global _cache
+    if _cache is None:
+        _cache = DiskCache(TRANSCRIPTION_CACHE_DIR, TRANSCRIPTION_CACHE_MAX_BYTES)
+    return _cache
+
+def transcription_cache_key(media_hash, language, model, audio_profile=None, speech_only=False):
+    # The audio sent to Deepgram is derived deterministically from the source
+    # media and the audio profile, so hashing the source lets a hit skip extraction.
+    if speech_only:
+        # VAD-trimmed uploads can transcribe differently from the full audio
+        return make_key("transcription", media_hash, audio_profile, language, model, "speech_only")
+    return make_key("transcription", media_hash, audio_profile, language, model)
+
+def load_transcription(key):
+    cache = get_transcription_cache()
+    entry_dir = cache.get(key)
+    if entry_dir is None:
+        cache_requests.inc(cache="transcription", result="miss")
+        logging.info(f"Transcription cache miss ({cache.hits} hits / {cache.misses} misses)")
+        return None
+    try:
+        with open(os.path.join(entry_dir, "transcription.json"), "r") as f:
+            entry = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Unreadable transcription cache entry {key}: {str(e)}")
+        cache_requests.inc(cache="transcription", result="miss")
+        return None
+    cache_requests.inc(cache="transcription", result="hit")
+    logging.info(f"Transcription cache hit ({cache.hits} hits / {cache.misses} misses)")
+    return entry["response"], entry["duration"]
+
+def store_transcription(key, response, duration):
+    cache = get_transcription_cache()
+    staging_dir = cache.staging_dir()
+    with open(os.path.join(staging_dir, "transcription.json"), "w") as f:
+        json.dump({"response": response, "duration": duration}, f)
+    cache.commit(key, staging_dir)
@@ -0,0 +1,149 @@
+"""Process-wide client for the transcription API.
+
+Every request from every Streamlit session (each running its own event loop)
+and from the batch CLI goes through one httpx.AsyncClient that lives on a
+dedicated background event loop, so TLS connections are pooled and kept
+alive, and the concurrency and rate limits are global to the process.
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+import httpx
+from metrics import Counter, queue_wait
+
+DEEPGRAM_API_KEY = os.environ.get("DG_API_KEY")
+# Override to point the client at a local stub server
+DEEPGRAM_API_URL = os.environ.get("DG_API_URL") or "https://api.deepgram.com"
+
+TRANSCRIPTION_TIMEOUT = float(os.environ.get("TRANSCRIPTION_TIMEOUT", 300))
+# Requests in flight across all sessions, and pooled connections kept for them
+TRANSCRIPTION_MAX_IN_FLIGHT = int(os.environ.get("TRANSCRIPTION_MAX_IN_FLIGHT", 16))
+# Token bucket: sustained requests per second and the burst allowed above it
+TRANSCRIPTION_RATE_LIMIT = float(os.environ.get("TRANSCRIPTION_RATE_LIMIT", 5))
+TRANSCRIPTION_RATE_BURST = int(os.environ.get("TRANSCRIPTION_RATE_BURST", 10))
+TRANSCRIPTION_RETRIES = int(os.environ.get("TRANSCRIPTION_RETRIES", os.environ.get("TRANSCRIPTION_CHUNK_RETRIES", 3)))
+TRANSCRIPTION_BACKOFF_BASE = float(os.environ.get("TRANSCRIPTION_BACKOFF_BASE", 1.0))
+TRANSCRIPTION_BACKOFF_MAX = float(os.environ.get("TRANSCRIPTION_BACKOFF_MAX", 30.0))
+
+# Transcription has no side effects, so these are safe to retry
+RETRYABLE_STATUS = (408, 429, 500, 502, 503, 504)
+
+transcription_retries = Counter("transcription_retries_total", "Transcription requests retried", ("reason",))
+
+class TranscriptionError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+class TokenBucket:
+    """Rate limiter for coroutines on a single event loop."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def backoff_delay(attempt, base=TRANSCRIPTION_BACKOFF_BASE, cap=TRANSCRIPTION_BACKOFF_MAX):
+    # Equal jitter: at least half the exponential delay, spread so retries from many sessions do not align
+    delay = min(cap, base * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def _retry_after(response):
+    try:
+        return min(TRANSCRIPTION_BACKOFF_MAX, float(response.headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return None
+
+class TranscriptionClient:
+    def __init__(self, api_key=DEEPGRAM_API_KEY, base_url=DEEPGRAM_API_URL, max_in_flight=TRANSCRIPTION_MAX_IN_FLIGHT,
+                 rate=TRANSCRIPTION_RATE_LIMIT, burst=TRANSCRIPTION_RATE_BURST, retries=TRANSCRIPTION_RETRIES,
+                 timeout=TRANSCRIPTION_TIMEOUT):
+        if not api_key:
+            raise ValueError("Deepgram API key is not set. Please set the DG_API_KEY environment variable.")
+        self.base_url = base_url
+        self.retries = retries
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="transcription-client", daemon=True).start()
+        # The client, semaphore and bucket belong to the background loop and are only used from it
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            headers={"Authorization": f"Token {api_key}"},
+            limits=httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight),
+            timeout=httpx.Timeout(timeout, connect=10.0),
+        )
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._bucket = TokenBucket(rate, burst)
+
+    async def transcribe(self, body, params):
+        """POST audio to /v1/listen from any event loop and return the decoded JSON response.
+
+        body is bytes or a callable returning a fresh async iterable of
+        chunks; the callable is invoked on the client's loop for every
+        attempt, so streamed uploads can be retried.
+        """
+        future = asyncio.run_coroutine_threadsafe(self._transcribe(body, params), self._loop)
+        # Cancelling the caller (e.g. a timeout) cancels the request on the client loop
+        return await asyncio.wrap_future(future)
+
+    async def _transcribe(self, body, params):
+        for attempt in range(self.retries + 1):
+            queued_time = time.time()
+            await self._bucket.acquire()
+            async with self._semaphore:
+                queue_wait.observe(time.time() - queued_time, queue="transcription", kind=params.get("model"))
+                content = body() if callable(body) else body
+                try:
+                    response = await self._client.post("/v1/listen", params=params, content=content)
+                except httpx.ReadTimeout:
+                    # The request was uploaded and processed too long; a retry would only wait as long again
+                    raise
+                except httpx.TransportError as e:
+                    error, reason, delay = e, type(e).__name__, None
+                else:
+                    if response.status_code not in RETRYABLE_STATUS:
+                        if response.is_error:
+                            raise TranscriptionError(f"HTTP {response.status_code}: {response.text[:500]}", response.status_code)
+                        return response.json()
+                    error = TranscriptionError(f"HTTP {response.status_code}: {response.text[:500]}", response.status_code)
+                    reason, delay = str(response.status_code), _retry_after(response)
+                finally:
+                    if hasattr(content, "aclose"):
+                        # Stops the producer (e.g. kills ffmpeg) if the upload did not consume it
+                        await content.aclose()
+
+            if attempt == self.retries:
+                raise error
+            delay = delay if delay is not None else backoff_delay(attempt)
+            transcription_retries.inc(reason=reason)
+            logging.warning(f"Transcription request failed ({reason}), retry {attempt + 1}/{self.retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_transcription_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = TranscriptionClient()
+    return _client
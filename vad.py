@@ -0,0 +1,201 @@
+"""Energy-based voice activity detection over 16 kHz PCM WAV files.
+
+The WAV is memory-mapped and frame RMS is computed block by block with
+NumPy, so hours of audio are analysed without loading them whole. Speech
+regions are concatenated into a shorter file for transcription and an
+OffsetMap converts timestamps in that file back to source time.
+"""
+import os
+import struct
+import logging
+import subprocess
+import wave
+import numpy as np
+
+# Trim silence and music-only stretches before transcription
+VAD_TRIM = os.environ.get("VAD_TRIM", "0") == "1"
+VAD_FRAME_SECONDS = float(os.environ.get("VAD_FRAME_SECONDS", 0.03))
+# Frames louder than the noise floor by this much, and above the absolute floor, count as speech
+VAD_MARGIN_DB = float(os.environ.get("VAD_MARGIN_DB", 12))
+VAD_FLOOR_DB = float(os.environ.get("VAD_FLOOR_DB", -50))
+# Shorter gaps are kept so sentences are not cut apart
+VAD_MIN_SILENCE = float(os.environ.get("VAD_MIN_SILENCE", 0.8))
+VAD_MIN_SPEECH = float(os.environ.get("VAD_MIN_SPEECH", 0.2))
+VAD_PADDING = float(os.environ.get("VAD_PADDING", 0.25))
+# Silence inserted between concatenated regions, so the recogniser still sees a pause
+VAD_JOIN_GAP = float(os.environ.get("VAD_JOIN_GAP", 0.3))
+
+# Frames per vectorised RMS block, bounds the float32 working copy to a few MB
+RMS_BLOCK_FRAMES = 4096
+# Samples copied out of the memory map per write when concatenating speech
+WRITE_BLOCK_SAMPLES = 1024 * 1024
+
+def wav_layout(path):
+    """Return (data offset, data bytes, sample rate, channels, sample width) of a PCM WAV."""
+    with open(path, "rb") as f:
+        riff, _, wave_id = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave_id != b"WAVE":
+            raise ValueError(f"{path} is not a WAV file")
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"No data chunk in {path}")
+            chunk_id, size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                audio_format, channels, rate, _, _, bits = struct.unpack("<HHIIHH", f.read(16))
+                f.seek(size - 16 + (size & 1), os.SEEK_CUR)
+                fmt = (audio_format, channels, rate, bits // 8)
+            elif chunk_id == b"data":
+                if fmt is None or fmt[0] != 1 or fmt[3] != 2:
+                    raise ValueError(f"{path} is not 16-bit PCM")
+                offset = f.tell()
+                # Streamed WAVs may carry a placeholder size
+                size = min(size, os.path.getsize(path) - offset)
+                return offset, size, fmt[2], fmt[1], fmt[3]
+            else:
+                f.seek(size + (size & 1), os.SEEK_CUR)
+
+def map_samples(path):
+    offset, size, rate, channels, width = wav_layout(path)
+    frames = size // (width * channels)
+    if frames == 0:
+        return np.zeros((0, channels), dtype="<i2"), rate
+    samples = np.memmap(path, dtype="<i2", mode="r", offset=offset, shape=(frames, channels))
+    return samples, rate
+
+def frame_levels(samples, frame_length):
+    """RMS level in dBFS of consecutive frames, computed without copying the whole file."""
+    count = len(samples) // frame_length
+    levels = np.empty(count, dtype=np.float32)
+    for start in range(0, count, RMS_BLOCK_FRAMES):
+        stop = min(count, start + RMS_BLOCK_FRAMES)
+        block = samples[start * frame_length:stop * frame_length].astype(np.float32)
+        block = block.reshape(stop - start, -1) / 32768.0
+        levels[start:stop] = np.sqrt(np.mean(block * block, axis=1))
+    return 20 * np.log10(np.maximum(levels, 1e-10))
+
+def speech_regions(levels, frame_seconds, margin_db=VAD_MARGIN_DB, floor_db=VAD_FLOOR_DB,
+                   min_silence=VAD_MIN_SILENCE, min_speech=VAD_MIN_SPEECH, padding=VAD_PADDING):
+    """Return speech regions as an (n, 2) array of [start, end) seconds."""
+    if len(levels) == 0:
+        return np.zeros((0, 2))
+    noise_floor = np.percentile(levels, 10)
+    threshold = max(floor_db, noise_floor + margin_db)
+    active = np.concatenate(([False], levels > threshold, [False]))
+    edges = np.flatnonzero(np.diff(active.astype(np.int8)))
+    starts, ends = edges[0::2] * frame_seconds, edges[1::2] * frame_seconds
+    if len(starts) == 0:
+        return np.zeros((0, 2))
+
+    # Bridge short pauses, then drop blips too short to be words
+    keep = np.concatenate(([True], starts[1:] - ends[:-1] >= min_silence))
+    starts = starts[keep]
+    ends = np.maximum.reduceat(ends, np.flatnonzero(keep))
+    long_enough = ends - starts >= min_speech
+    starts, ends = starts[long_enough], ends[long_enough]
+    if len(starts) == 0:
+        return np.zeros((0, 2))
+
+    duration = len(levels) * frame_seconds
+    starts = np.maximum(0.0, starts - padding)
+    ends = np.minimum(duration, ends + padding)
+    # Padding can make neighbours overlap
+    keep = np.concatenate(([True], starts[1:] > ends[:-1]))
+    starts = starts[keep]
+    ends = np.maximum.reduceat(ends, np.flatnonzero(keep))
+    return np.column_stack((starts, ends))
+
+class OffsetMap:
+    """Maps times in the concatenated speech audio back to the source audio."""
+
+    def __init__(self, regions, join_gap=VAD_JOIN_GAP, source_duration=None):
+        regions = np.asarray(regions, dtype=np.float64).reshape(-1, 2)
+        self.source_starts = regions[:, 0]
+        self.lengths = regions[:, 1] - regions[:, 0]
+        # Where each region begins in the trimmed audio
+        self.trimmed_starts = np.concatenate(([0.0], np.cumsum(self.lengths + join_gap)[:-1]))
+        self.source_duration = source_duration
+
+    @property
+    def trimmed_duration(self):
+        if len(self.lengths) == 0:
+            return 0.0
+        return float(self.trimmed_starts[-1] + self.lengths[-1])
+
+    def to_source(self, times):
+        times = np.asarray(times, dtype=np.float64)
+        if len(self.lengths) == 0:
+            return times
+        index = np.clip(np.searchsorted(self.trimmed_starts, times, side="right") - 1, 0, None)
+        # Times inside a join gap snap to the end of the region before it
+        within = np.clip(times - self.trimmed_starts[index], 0.0, self.lengths[index])
+        return self.source_starts[index] + within
+
+def _remap_items(items, offset_map):
+    if not items:
+        return
+    times = offset_map.to_source([[item["start"], item["end"]] for item in items])
+    for item, (start, end) in zip(items, times.tolist()):
+        item["start"] = start
+        item["end"] = end
+
+def remap_transcription(response, offset_map):
+    """Convert word, sentence and paragraph times of a Deepgram response to source time, in place."""
+    for channel in response["results"]["channels"]:
+        for alternative in channel["alternatives"]:
+            _remap_items(alternative.get("words"), offset_map)
+            paragraphs = (alternative.get("paragraphs") or {}).get("paragraphs", [])
+            _remap_items(paragraphs, offset_map)
+            _remap_items([sentence for paragraph in paragraphs for sentence in paragraph.get("sentences", [])], offset_map)
+    if offset_map.source_duration is not None:
+        response["metadata"]["duration"] = offset_map.source_duration
+    return response
+
+def write_speech_wav(samples, rate, regions, output_path, join_gap=VAD_JOIN_GAP):
+    gap = np.zeros((int(round(join_gap * rate)), samples.shape[1]), dtype="<i2").tobytes()
+    with wave.open(output_path, "wb") as out:
+        out.setnchannels(samples.shape[1])
+        out.setsampwidth(2)
+        out.setframerate(rate)
+        for i, (start, end) in enumerate(regions):
+            if i:
+                out.writeframes(gap)
+            # In bounded slices, a region of continuous speech can span the whole file
+            end_sample = int(round(end * rate))
+            for offset in range(int(round(start * rate)), end_sample, WRITE_BLOCK_SAMPLES):
+                out.writeframes(samples[offset:min(offset + WRITE_BLOCK_SAMPLES, end_sample)].tobytes())
+
+def trim_to_speech(wav_path, output_path, encode_args=None, output_format="wav"):
+    """Write only the speech regions of wav_path to output_path and return their OffsetMap.
+
+    With encode_args the concatenated speech is encoded by ffmpeg (e.g. to
+    Opus) instead of being written as WAV.
+    """
+    samples, rate = map_samples(wav_path)
+    frame_length = max(1, int(round(VAD_FRAME_SECONDS * rate)))
+    frame_seconds = frame_length / rate
+    source_duration = len(samples) / rate
+    regions = speech_regions(frame_levels(samples, frame_length), frame_seconds)
+    if len(regions) == 0:
+        # Nothing sounded like speech; send everything rather than nothing
+        regions = np.array([[0.0, source_duration]])
+    # Whole samples, so the map matches the written audio exactly
+    regions = np.round(regions * rate) / rate
+    join_gap = round(VAD_JOIN_GAP * rate) / rate
+    offset_map = OffsetMap(regions, join_gap, source_duration)
+    logging.info(f"VAD kept {len(regions)} speech regions, {offset_map.trimmed_duration:.1f}s of {source_duration:.1f}s")
+
+    if encode_args is None:
+        write_speech_wav(samples, rate, regions, output_path, join_gap)
+        return offset_map
+
+    speech_wav = output_path + ".speech.wav"
+    try:
+        write_speech_wav(samples, rate, regions, speech_wav, join_gap)
+        cmd = ['ffmpeg', '-y', '-v', 'error', '-i', speech_wav, *encode_args, '-f', output_format, output_path]
+        subprocess.run(cmd, check=True)
+    finally:
+        if os.path.exists(speech_wav):
+            os.remove(speech_wav)
+    return offset_map
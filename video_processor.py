@@ -1,22 +1,429 @@
 import os
+import re
+import json
 import time
+import asyncio
 import logging
+import threading
 import subprocess
 from multiprocessing import cpu_count
+from subtitle_track import SubtitleTrack
+from encoder_profile import RENDER_TARGET_RATIO, encode_args, quality_args, select_profile, select_thread_type, thread_args
+from metrics import current_span, file_size, traced
 
 # Get CPU count once at the beginning
 processes = cpu_count()
 
-def extract_audio(video_path, audio_path):
+# Audio profiles used for the transcription payload. Speech recognition works on
+# 16 kHz mono, so anything above that is only extra bytes to upload.
+AUDIO_PROFILES = {
+    "wav": {
+        "args": ['-acodec', 'pcm_s16le', '-ar', '16000', '-ac', '1'],
+        "format": "wav",
+        "ext": ".wav",
+    },
+    "flac": {
+        "args": ['-acodec', 'flac', '-ar', '16000', '-ac', '1'],
+        "format": "flac",
+        "ext": ".flac",
+    },
+    "opus": {
+        "args": ['-acodec', 'libopus', '-b:a', '32k', '-ar', '16000', '-ac', '1', '-application', 'voip'],
+        "format": "ogg",
+        "ext": ".ogg",
+    },
+    # Stream copy of the source track, only valid when the source codec is listed
+    "copy": {
+        "args": ['-acodec', 'copy'],
+        "format": "adts",
+        "ext": ".aac",
+        "source_codecs": ("aac",),
+    },
+}
+
+TRANSCRIPTION_AUDIO_PROFILE = os.environ.get("TRANSCRIPTION_AUDIO_PROFILE", "opus")
+COPY_FALLBACK_PROFILE = "opus"
+
+def probe_audio_codec(video_path):
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'a:0',
+        '-show_entries', 'stream=codec_name',
+        '-of', 'default=noprint_wrappers=1:nokey=1',
+        video_path
+    ]
+    result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+def resolve_audio_profile(video_path, profile=None, audio_codec=None):
+    profile = profile or TRANSCRIPTION_AUDIO_PROFILE
+    if profile not in AUDIO_PROFILES:
+        raise ValueError(f"Unknown transcription audio profile: {profile}")
+
+    source_codecs = AUDIO_PROFILES[profile].get("source_codecs")
+    if source_codecs:
+        codec = audio_codec
+        if codec is None:
+            try:
+                codec = probe_audio_codec(video_path)
+            except subprocess.CalledProcessError:
+                codec = None
+        if codec not in source_codecs:
+            logging.info(f"Cannot stream copy '{codec}' audio, falling back to '{COPY_FALLBACK_PROFILE}' profile")
+            return COPY_FALLBACK_PROFILE
+    return profile
+
+def audio_path_for_profile(output_dir, profile, basename="audio"):
+    return os.path.join(output_dir, basename + AUDIO_PROFILES[profile]["ext"])
+
+PROGRESS_LOG_INTERVAL = 10.0
+
+def _parse_float(value):
+    try:
+        return float(value.rstrip('x'))
+    except (AttributeError, ValueError):
+        return None
+
+def _progress_snapshot(fields, duration, elapsed):
+    out_time_us = _parse_float(fields.get("out_time_us"))
+    out_time = out_time_us / 1_000_000 if out_time_us is not None and out_time_us >= 0 else None
+    speed = _parse_float(fields.get("speed"))
+    progress = {
+        "frame": int(fields["frame"]) if fields.get("frame", "").isdigit() else None,
+        "fps": _parse_float(fields.get("fps")),
+        "speed": speed,
+        "out_time": out_time,
+        "duration": duration,
+        "elapsed": elapsed,
+        "percent": None,
+        "eta": None,
+        "done": fields.get("progress") == "end",
+    }
+    if duration and out_time is not None:
+        progress["percent"] = min(100.0, 100.0 * out_time / duration)
+        if speed:
+            progress["eta"] = max(0.0, (duration - out_time) / speed)
+    return progress
+
+def run_ffmpeg(cmd, duration=None, on_progress=None, timeout=None, label="ffmpeg"):
+    """Run an ffmpeg command, parsing its -progress output as it runs.
+
+    on_progress is called with a dict (frame, fps, speed, out_time, percent,
+    eta, ...) on every progress update. Progress is also logged every
+    PROGRESS_LOG_INTERVAL seconds, and a timing summary when the run ends.
+    """
+    cmd = [cmd[0], '-progress', 'pipe:1', '-nostats', *cmd[1:]]
+    start_time = time.time()
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+    # Drain stderr concurrently so a chatty ffmpeg cannot block on a full pipe
+    stderr_lines = []
+    stderr_thread = threading.Thread(target=lambda: stderr_lines.extend(process.stderr), daemon=True)
+    stderr_thread.start()
+
+    timed_out = threading.Event()
+    def kill_on_timeout():
+        timed_out.set()
+        process.kill()
+    timer = threading.Timer(timeout, kill_on_timeout) if timeout else None
+    if timer:
+        timer.start()
+
+    fields = {}
+    progress = None
+    last_log = start_time
+    try:
+        for line in process.stdout:
+            key, _, value = line.strip().partition('=')
+            if not key:
+                continue
+            fields[key] = value
+            if key != "progress":
+                continue
+            progress = _progress_snapshot(fields, duration, time.time() - start_time)
+            if on_progress is not None:
+                on_progress(progress)
+            if time.time() - last_log >= PROGRESS_LOG_INTERVAL:
+                last_log = time.time()
+                logging.info(f"{label}: {format_progress(progress)}")
+        returncode = process.wait()
+    finally:
+        if timer:
+            timer.cancel()
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        stderr_thread.join()
+
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=''.join(stderr_lines[-20:]))
+
+    elapsed = time.time() - start_time
+    summary = f"{label} completed in {elapsed:.2f} seconds"
+    if progress is not None:
+        summary += f" ({format_progress(progress)})"
+    logging.info(summary)
+    return progress
+
+def format_progress(progress):
+    """Percent, fps, speed and ETA of a progress snapshot, for logs and progress bars."""
+    parts = []
+    if progress["percent"] is not None:
+        parts.append(f"{progress['percent']:.1f}%")
+    if progress["fps"]:
+        parts.append(f"{progress['fps']:.1f} fps")
+    if progress["speed"]:
+        parts.append(f"{progress['speed']:.2f}x")
+    if progress["eta"] is not None and not progress["done"]:
+        parts.append(f"ETA {progress['eta']:.0f}s")
+    return ", ".join(parts) or "running"
+
+def _media_duration(media_path, media_duration=None):
+    # Callers pass the duration probed at ingest, so the file is not probed again
+    if media_duration is not None:
+        return media_duration
+    try:
+        return probe_duration(media_path)
+    except (subprocess.CalledProcessError, ValueError):
+        return None
+
+@traced()
+def extract_audio(video_path, audio_path, profile=None, on_progress=None, media_duration=None):
+    profile = profile or TRANSCRIPTION_AUDIO_PROFILE
+    settings = AUDIO_PROFILES[profile]
     cmd = [
         'ffmpeg', '-y','-i', video_path,
-        '-vn', '-acodec', 'pcm_s16le',
-        '-ar', '44100', '-ac', '2',
+        '-vn', *settings["args"],
+        '-f', settings["format"],
         audio_path
     ]
-    subprocess.run(cmd, check=True)
+    duration = _media_duration(video_path, media_duration)
+    run_ffmpeg(cmd, duration, on_progress, label="Audio extraction")
+    current_span().set(profile=profile, bytes_in=file_size(video_path), bytes_out=file_size(audio_path))
+
+STREAM_CHUNK_SIZE = 64 * 1024
+PROGRESS_FIELD_RE = re.compile(r"^(\w+)=(\S*)$")
+
+async def _read_stderr(stream, duration=None, on_progress=None):
+    # -progress fields and log messages share stderr when stdout carries the audio
+    start_time = time.time()
+    fields = {}
+    lines = []
+    async for raw_line in stream:
+        line = raw_line.decode(errors="replace")
+        match = PROGRESS_FIELD_RE.match(line.strip()) if on_progress is not None else None
+        if match is None:
+            lines.append(line)
+            continue
+        key, value = match.groups()
+        fields[key] = value
+        if key == "progress":
+            on_progress(_progress_snapshot(fields, duration, time.time() - start_time))
+    return ''.join(lines[-20:])
+
+async def stream_audio(video_path, profile=None, chunk_size=STREAM_CHUNK_SIZE, duration=None, on_progress=None):
+    """Yield encoded audio from ffmpeg's stdout while it is still being produced.
+
+    The pipe gives natural backpressure: ffmpeg blocks when the consumer stops
+    reading, so progress reported to on_progress follows the upload. The
+    ffmpeg child is killed if the consumer stops early, fails or is cancelled.
+    """
+    profile = profile or TRANSCRIPTION_AUDIO_PROFILE
+    settings = AUDIO_PROFILES[profile]
+    cmd = [
+        'ffmpeg', '-v', 'error', '-i', video_path,
+        '-vn', *settings["args"],
+        '-f', settings["format"],
+        'pipe:1'
+    ]
+    if on_progress is not None:
+        cmd[1:1] = ['-progress', 'pipe:2', '-nostats']
+    process = await asyncio.create_subprocess_exec(
+        *cmd, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stderr_task = asyncio.create_task(_read_stderr(process.stderr, duration, on_progress))
+    try:
+        while True:
+            chunk = await process.stdout.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+        returncode = await process.wait()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd, stderr=await stderr_task)
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        if not stderr_task.done():
+            stderr_task.cancel()
 
-def add_subtitles_to_video(video_path, subtitle_file, output_path, font_color, bg_color, font_size, transparency, temp_file_name):
+def probe_duration(media_path):
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1',
+        media_path
+    ]
+    result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    return float(result.stdout.strip())
+
+def probe_video(media_path):
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'stream=width,height,avg_frame_rate:format=duration',
+        '-of', 'json',
+        media_path
+    ]
+    result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    info = json.loads(result.stdout)
+    stream = info["streams"][0]
+    num, _, den = stream.get("avg_frame_rate", "30/1").partition('/')
+    fps = float(num) / float(den or 1) if float(num) > 0 else 30.0
+    return {
+        "width": int(stream["width"]),
+        "height": int(stream["height"]),
+        "fps": fps,
+        "duration": float(info["format"]["duration"]),
+    }
+
+def probe_media(media_path):
+    """Container, duration and first video/audio stream details in one ffprobe call."""
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-show_entries', 'format=format_name,duration:stream=codec_type,codec_name,width,height,avg_frame_rate',
+        '-of', 'json',
+        media_path
+    ]
+    result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    info = json.loads(result.stdout)
+    metadata = {
+        "format": info.get("format", {}).get("format_name"),
+        "duration": float(info["format"]["duration"]) if "duration" in info.get("format", {}) else None,
+        "video_codec": None,
+        "width": None,
+        "height": None,
+        "fps": None,
+        "audio_codec": None,
+    }
+    for stream in info.get("streams", []):
+        if stream.get("codec_type") == "video" and metadata["video_codec"] is None:
+            num, _, den = stream.get("avg_frame_rate", "0/1").partition('/')
+            metadata.update(
+                video_codec=stream.get("codec_name"),
+                width=stream.get("width"),
+                height=stream.get("height"),
+                fps=float(num) / float(den) if den and float(den) and float(num) else None,
+            )
+        elif stream.get("codec_type") == "audio" and metadata["audio_codec"] is None:
+            metadata["audio_codec"] = stream.get("codec_name")
+    return metadata
+
+SILENCE_START_RE = re.compile(r"silence_start: (-?[\d.]+)")
+SILENCE_END_RE = re.compile(r"silence_end: (-?[\d.]+)")
+
+def detect_silences(audio_path, noise_db=-35, min_silence=0.4):
+    cmd = [
+        'ffmpeg', '-hide_banner', '-nostats', '-i', audio_path,
+        '-af', f"silencedetect=noise={noise_db}dB:d={min_silence}",
+        '-f', 'null', '-'
+    ]
+    result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+
+    silences = []
+    start = None
+    for line in result.stderr.splitlines():
+        match = SILENCE_START_RE.search(line)
+        if match:
+            start = max(0.0, float(match.group(1)))
+            continue
+        match = SILENCE_END_RE.search(line)
+        if match and start is not None:
+            silences.append((start, float(match.group(1))))
+            start = None
+    return silences
+
+def plan_chunks(duration, silences, max_chunk=300.0, min_chunk=None):
+    """Split [0, duration] into chunks of at most max_chunk seconds.
+
+    Each cut is placed in the middle of the latest silence that keeps the
+    chunk between min_chunk and max_chunk seconds long, or at max_chunk when
+    no such silence exists.
+    """
+    if min_chunk is None:
+        min_chunk = max_chunk / 2
+    cut_points = [(start + end) / 2 for start, end in silences]
+
+    chunks = []
+    cursor = 0.0
+    while duration - cursor > max_chunk:
+        limit = cursor + max_chunk
+        candidates = [point for point in cut_points if cursor + min_chunk <= point <= limit]
+        cut = candidates[-1] if candidates else limit
+        chunks.append((cursor, cut))
+        cursor = cut
+    chunks.append((cursor, duration))
+    return chunks
+
+def split_audio(audio_path, chunks, output_dir, profile=None, timeout=None):
+    """Cut audio_path into chunk files, raising subprocess.TimeoutExpired after timeout seconds in total.
+
+    Chunks are re-encoded rather than stream copied: a copy can only cut at
+    packet boundaries, so each chunk would start slightly before its planned
+    offset and timestamps would drift at every seam.
+    """
+    profile = profile or TRANSCRIPTION_AUDIO_PROFILE
+    if profile == "copy":
+        profile = COPY_FALLBACK_PROFILE
+    settings = AUDIO_PROFILES[profile]
+    deadline = time.time() + timeout if timeout else None
+    paths = []
+    for i, (start, end) in enumerate(chunks):
+        chunk_path = os.path.join(output_dir, f"chunk_{i:04d}{settings['ext']}")
+        cmd = [
+            'ffmpeg', '-y', '-v', 'error',
+            '-ss', f"{start:.3f}", '-t', f"{end - start:.3f}",
+            '-i', audio_path,
+            *settings["args"], '-f', settings["format"],
+            chunk_path
+        ]
+        subprocess.run(cmd, check=True, timeout=max(0.0, deadline - time.time()) if deadline else None)
+        paths.append(chunk_path)
+    return paths
+
+# Fallback when the input cannot be probed for an adaptive encoder profile
+FALLBACK_ENCODER_PROFILE = {"preset": "ultrafast", "crf": 28, "thread_type": "frame"}
+
+def video_encoder_profile(video_path, threads=None, timeout=None, info=None):
+    """Encoder profile for video_path; info is its size, frame rate and duration if already probed."""
+    threads = threads or processes
+    try:
+        if not info or not all(info.get(key) for key in ("width", "height", "fps", "duration")):
+            info = probe_video(video_path)
+    except (subprocess.CalledProcessError, ValueError, KeyError, IndexError) as e:
+        logging.warning(f"Could not probe {video_path} for an encoder profile: {str(e)}")
+        return dict(FALLBACK_ENCODER_PROFILE, threads=threads)
+
+    budget = info["duration"] * RENDER_TARGET_RATIO
+    if timeout:
+        budget = min(budget, timeout)
+    profile = select_profile(info["width"], info["height"], info["duration"], info["fps"], threads, budget)
+    logging.info(f"Encoder profile for {info['width']}x{info['height']}, {info['duration']:.1f}s: "
+                 f"preset={profile['preset']} crf={profile['crf']} threads={profile['threads']} "
+                 f"({profile['thread_type']} threading), estimated {profile['estimated_seconds']:.1f}s")
+    return profile
+
+def video_encode_args(video_path, threads=None, timeout=None):
+    return encode_args(video_encoder_profile(video_path, threads, timeout))
+
+def render_quality_args(video_path, threads=None, timeout=None, info=None):
+    """Preset and CRF a render job with this core share would choose, fixed when it is queued."""
+    return quality_args(video_encoder_profile(video_path, threads, timeout, info))
+
+def subtitle_colours(font_color, bg_color, transparency):
     # Convert hex colors to RGB format for FFmpeg
     font_color = font_color.lstrip('#')
     bg_color = bg_color.lstrip('#')
@@ -25,24 +432,144 @@ def add_subtitles_to_video(video_path, subtitle_file, output_path, font_color, b
     bg_alpha = hex(int(255 * (1 - transparency/100)))[2:].zfill(2)
     font_alpha = bg_alpha  # Using same transparency for font
 
+    return f"&H{font_alpha}{font_color}", f"&H{bg_alpha}{bg_color}"
+
+def subtitle_style(font_color, bg_color, font_size, transparency):
+    primary_colour, back_colour = subtitle_colours(font_color, bg_color, transparency)
+
     # FFmpeg subtitle style
     font_path = os.path.join(os.getcwd(), 'fonts', 'LiberationSans-Regular.ttf')
-    style = f"FontName=LiberationSans-Regular,FontFile={font_path},FontSize={font_size},PrimaryColour=&H{font_alpha}{font_color},BackColour=&H{bg_alpha}{bg_color}"
+    return f"FontName=LiberationSans-Regular,FontFile={font_path},FontSize={font_size},PrimaryColour={primary_colour},BackColour={back_colour}"
+
+@traced()
+def add_subtitles_to_video(video_path, subtitle_file, output_path, font_color, bg_color, font_size, transparency, threads=None, timeout=None, on_progress=None, encoder=None, media_duration=None):
+    style = subtitle_style(font_color, bg_color, font_size, transparency)
+
+    # Render next to the output and rename when done, so readers never see a partial file
+    base, ext = os.path.splitext(output_path)
+    partial_path = f"{base}.part{ext}"
+    duration = _media_duration(video_path, media_duration)
+
+    if encoder is None:
+        encoder_args = video_encode_args(video_path, threads, timeout)
+    else:
+        # Preset and CRF were chosen when the job was queued (they are part of its cache key)
+        threads = threads or processes
+        encoder_args = [*encoder, *thread_args(threads, select_thread_type(duration, threads) if duration else "frame")]
 
     cmd = [
         'ffmpeg', '-y','-i', video_path,
         '-vf', f"subtitles={subtitle_file}:force_style='{style}'",
-        '-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '28',
+        *encoder_args,
         '-c:a', 'copy',
-        '-threads', str(processes),
-        output_path
+        partial_path
     ]
 
-    start_time = time.time()
-    subprocess.run(cmd, check=True)
-    duration = time.time() - start_time
-    logging.info(f"Video write completed in {duration:.2f} seconds")
+    try:
+        run_ffmpeg(cmd, duration, on_progress, timeout, label="Video write")
+        os.replace(partial_path, output_path)
+        current_span().set(bytes_in=file_size(video_path), bytes_out=file_size(output_path))
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+PREVIEW_MAX_HEIGHT = int(os.environ.get("PREVIEW_MAX_HEIGHT", 360))
+PREVIEW_FPS = int(os.environ.get("PREVIEW_FPS", 12))
+PREVIEW_ENCODE_ARGS = ['-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '32']
+
+def render_preview(video_path, subtitle_file, output_path, font_color, bg_color, font_size, transparency,
+                   start=None, duration=None, max_height=PREVIEW_MAX_HEIGHT, fps=PREVIEW_FPS,
+                   threads=None, timeout=None, on_progress=None, media_duration=None):
+    """Render a downscaled, low frame rate preview, optionally of a time window only.
+
+    The input is seeked to the window start, so timestamps are shifted back to
+    source time for the subtitles filter and reset to zero afterwards. libass
+    scales subtitles with the video height, so the preview looks the same as
+    the full render.
+    """
+    style = subtitle_style(font_color, bg_color, font_size, transparency)
+    start = start or 0.0
+
+    filters = [
+        f"fps={fps}",
+        f"scale=-2:'min({max_height},ih)'",
+        f"setpts=PTS+{start:.3f}/TB",
+        f"subtitles={subtitle_file}:force_style='{style}'",
+        "setpts=PTS-STARTPTS",
+    ]
+
+    window = []
+    if start:
+        window += ['-ss', f"{start:.3f}"]
+    if duration:
+        window += ['-t', f"{duration:.3f}"]
+
+    base, ext = os.path.splitext(output_path)
+    partial_path = f"{base}.part{ext}"
+
+    cmd = [
+        'ffmpeg', '-y', *window, '-i', video_path,
+        '-vf', ','.join(filters),
+        *PREVIEW_ENCODE_ARGS,
+        '-c:a', 'aac', '-b:a', '64k', '-ac', '1',
+        '-threads', str(threads or processes),
+        partial_path
+    ]
+
+    if not duration:
+        duration = _media_duration(video_path, media_duration)
+        if duration is not None:
+            duration -= start
+
+    try:
+        run_ffmpeg(cmd, duration, on_progress, timeout, label="Preview write")
+        os.replace(partial_path, output_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+# Subtitle codec used for soft subtitles per output container
+SOFT_SUBTITLE_CODECS = {
+    ".mp4": "mov_text",
+    ".m4v": "mov_text",
+    ".mov": "mov_text",
+    ".mkv": "ass",
+}
+
+def mux_subtitles(video_path, subtitle_file, output_path, font_color, bg_color, font_size, transparency,
+                  threads=None, timeout=None, on_progress=None, media_duration=None):
+    """Attach subtitles as a selectable stream, copying the video and audio unchanged.
+
+    The track is converted to ASS with the same style as a burned-in render.
+    MKV keeps the ASS styling as is; MP4 uses mov_text, which keeps font size
+    and colours.
+    """
+    base, ext = os.path.splitext(output_path)
+    codec = SOFT_SUBTITLE_CODECS.get(ext.lower())
+    if codec is None:
+        raise ValueError(f"Soft subtitles are not supported for {ext} outputs")
+
+    primary_colour, back_colour = subtitle_colours(font_color, bg_color, transparency)
+    ass_path = f"{base}.ass"
+    with open(ass_path, "w", encoding="utf-8") as f:
+        f.write(SubtitleTrack.load(subtitle_file).to_ass(font_size=font_size, primary_colour=primary_colour, back_colour=back_colour))
+
+    partial_path = f"{base}.part{ext}"
+    cmd = [
+        'ffmpeg', '-y', '-i', video_path, '-i', ass_path,
+        # 0:V leaves out attached pictures (cover art, thumbnails), which cannot be stream copied as video
+        '-map', '0:V', '-map', '0:a?', '-map', '1:0',
+        '-c', 'copy', '-c:s', codec,
+        '-disposition:s:0', 'default',
+        partial_path
+    ]
+    duration = _media_duration(video_path, media_duration)
 
-def time_to_seconds(time_str):
-    h, m, s = time_str.split(':')
-    return int(h) * 3600 + int(m) * 60 + float(s)
\ No newline at end of file
+    try:
+        run_ffmpeg(cmd, duration, on_progress, timeout, label="Subtitle mux")
+        os.replace(partial_path, output_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        if os.path.exists(ass_path):
+            os.remove(ass_path)